@@ -0,0 +1,97 @@
+import os
+import subprocess
+import numpy as np
+from os.path import join
+from moviepy.config import get_setting
+from settings import *
+from proxy import proxyAudio
+
+
+class NoteBank:
+    """The audio of the pack notes, each decoded once into a float32 array of (samples, channels)."""
+    def __init__(self, fps: int = AUDIO_FPS, channels: int = 2):
+        self.fps = fps
+        self.channels = channels
+        self.buffers = {}
+
+    def get(self, pack_name: str, note: str):
+        key = (pack_name, note)
+        if key not in self.buffers:
+            cmd = [get_setting("FFMPEG_BINARY"), "-v", "error", "-i", proxyAudio(pack_name, note) or join(pack_name, note+".mp4"), "-vn",
+                   "-f", "f32le", "-ac", str(self.channels), "-ar", str(self.fps), "-"]
+            out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout
+            self.buffers[key] = np.frombuffer(out, dtype=np.float32).reshape(-1, self.channels)
+        return self.buffers[key]
+
+def placeSounds(script, blocks, pack_name: str, bank: NoteBank, audio_offset: float = AUDIO_OFFSET) -> list:
+    """(start sample, buffer) of every note of the song, X entries resolved to the notes of their block, by start."""
+    sounds = []
+    for entry in script:
+        notes = blocks[int(entry["note"][1:])]["notes"] if entry["note"][0] == 'X' else [entry["note"]]
+        start = int(round((entry["time"] + audio_offset) * bank.fps))
+        for note in notes:
+            buffer = bank.get(pack_name, note)
+            if start < 0: buffer = buffer[-start:]
+            sounds.append((max(start, 0), buffer))
+    sounds.sort(key=lambda sound: sound[0])
+    return sounds
+
+def mixScore(script, blocks=[], pack_name: str = PACK_NAME, bank: NoteBank = None, audio_offset: float = AUDIO_OFFSET, gain: float = 1.0):
+    """
+    Mixes the whole song: the buffer of every note, X entries resolved to the notes of their block,
+    is scaled and added in at the sample of its start time moved by `audio_offset`. Notes sound as
+    long as their clip, like in the rendered clips.
+    """
+    if bank == None: bank = NoteBank()
+    sounds = placeSounds(script, blocks, pack_name, bank, audio_offset)
+    length = max((start + len(buffer) for start, buffer in sounds), default=0)
+    mix = np.zeros((length, bank.channels), dtype=np.float32)
+    for start, buffer in sounds:
+        mix[start:start+len(buffer)] += buffer
+    if gain != 1.0: mix *= gain
+    return mix
+
+def writeTrack(mix, path: str, fps: int = AUDIO_FPS):
+    """Writes a mix as 16 bit .wav or, for any other extension, as AAC. Samples over full scale are clipped."""
+    codec = ["-c:a", "pcm_s16le"] if path.endswith(".wav") else ["-c:a", "aac", "-b:a", "192k"]
+    cmd = [get_setting("FFMPEG_BINARY"), "-y", "-v", "error", "-f", "f32le", "-ac", str(mix.shape[1]), "-ar", str(fps), "-i", "-"] + codec + [path]
+    subprocess.run(cmd, input=np.clip(mix, -1, 1).astype(np.float32).tobytes(), stderr=subprocess.PIPE, check=True)
+    return path
+
+def renderTrack(script, blocks=[], out_path: str = "movie.m4a", pack_name: str = PACK_NAME, block_size: int = AUDIO_BLOCK):
+    """
+    Mixes the song and writes it, like writeTrack(mixScore(...)), but `block_size` samples at a time
+    straight into the encoder, so besides the note buffers only one block is ever in memory no matter
+    how long the song is. Returns the path or None for a song without sound.
+    """
+    bank = NoteBank()
+    sounds = placeSounds(script, blocks, pack_name, bank)
+    if not any(buffer.any() for buffer in bank.buffers.values()): return None
+    length = max(start + len(buffer) for start, buffer in sounds)
+    directory = os.path.dirname(out_path)
+    if directory != "" and not os.path.exists(directory): os.makedirs(directory)
+
+    codec = ["-c:a", "pcm_s16le"] if out_path.endswith(".wav") else ["-c:a", "aac", "-b:a", "192k"]
+    cmd = [get_setting("FFMPEG_BINARY"), "-y", "-v", "error", "-f", "f32le", "-ac", str(bank.channels), "-ar", str(bank.fps), "-i", "-"] + codec + [out_path]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    mix = np.zeros((block_size, bank.channels), dtype=np.float32)
+    playing = [] #Sounds that started before the block
+    next_sound = 0
+    for block_start in range(0, length, block_size):
+        block_end = min(block_start + block_size, length)
+        while next_sound < len(sounds) and sounds[next_sound][0] < block_end:
+            playing.append(sounds[next_sound])
+            next_sound += 1
+        playing = [(start, buffer) for start, buffer in playing if start + len(buffer) > block_start]
+
+        mix[:] = 0
+        for start, buffer in playing:
+            first = max(start, block_start)
+            last = min(start + len(buffer), block_end)
+            mix[first-block_start:last-block_start] += buffer[first-start:last-start]
+        np.clip(mix, -1, 1, out=mix)
+        proc.stdin.write(mix[:block_end-block_start].tobytes())
+    proc.stdin.close()
+    error = proc.stderr.read()
+    if proc.wait() != 0: raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=error)
+    return out_path
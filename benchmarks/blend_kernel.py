@@ -0,0 +1,56 @@
+"""
+Micro-benchmark of the chord block blend.
+
+Run from the repository root:  python -m benchmarks.blend_kernel [width height]
+
+Blends 2 to 10 random frames with the opacity ramp (1/n)*(n-i) three ways: CompositeVideoClip with
+set_opacity, like renderClip used to, the layer by layer numpy loop the direct compositor used, and
+BlendKernel. Prints the time per frame and the largest difference of the numpy loop and of the
+kernel to CompositeVideoClip, the kernel's has to be 0.
+"""
+import sys
+from timeit import timeit
+
+import numpy as np
+import moviepy.editor as mp
+
+from blend import BlendKernel, rampOpacity
+
+
+def moviepyBlend(frames, size):
+    n = len(frames)
+    track = [mp.ImageClip(frame, duration=1).set_opacity(rampOpacity(i, n)) for i, frame in enumerate(frames)]
+    video = mp.CompositeVideoClip(track, size=size)
+    return lambda: video.get_frame(0).astype(np.uint8)
+
+def legacyBlend(frames, size):
+    # The loop compositor.layerFrame used before BlendKernel
+    n = len(frames)
+    blend = np.zeros((size[1], size[0], 3), dtype=np.float32)
+    for i, source in enumerate(frames):
+        opacity = (1/n)*(n-i)
+        blend *= 1 - opacity
+        blend += opacity * source
+    return blend.astype(np.uint8)
+
+
+def main(size=(1920, 1080), number: int = 10):
+    rng = np.random.default_rng(0)
+    kernel = BlendKernel(size)
+    print(f"{'notes':>6} {'moviepy':>12} {'numpy loop':>12} {'kernel':>12} {'loop diff':>9} {'kernel diff':>11}   [ms per frame]")
+    for n in range(2, 11):
+        frames = [rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8) for _ in range(n)]
+        opacities = [rampOpacity(i, n) for i in range(n)]
+        composite = moviepyBlend(frames, size)
+
+        reference = composite()
+        legacy_diff, kernel_diff = [int(np.abs(result.astype(np.int16) - reference).max()) for result in [legacyBlend(frames, size), kernel.blend(frames, opacities)]]
+
+        moviepy_time = timeit(composite, number=number) / number
+        legacy_time = timeit(lambda: legacyBlend(frames, size), number=number) / number
+        kernel_time = timeit(lambda: kernel.blend(frames, opacities), number=number) / number
+        print(f"{n:>6} {moviepy_time*1e3:>12.1f} {legacy_time*1e3:>12.1f} {kernel_time*1e3:>12.1f} {legacy_diff:>9} {kernel_diff:>11}")
+
+
+if __name__ == '__main__':
+    main(*([(int(sys.argv[1]), int(sys.argv[2]))] if len(sys.argv) > 2 else []))
@@ -0,0 +1,116 @@
+"""
+Benchmark of the X/Y help clip formats (HELP_CLIP_FORMATS in settings.py).
+
+Run from the repository root:  python -m benchmarks.help_clips [--seconds 10] [--out help_clips.json]
+
+Renders the X blocks and Y chunks of the first --seconds of every song in data/midis once per
+format and measures the encode time, the time to decode every frame of the Y chunks again (what the
+final composite does), the bytes on disk and the PSNR of the Y chunks against the uncompressed "raw"
+format. Everything is written to a scratch folder. Results are printed and written as JSON.
+"""
+import os
+import json
+import argparse
+import tempfile
+from time import perf_counter
+from os import listdir
+from os.path import join, getsize
+
+import numpy as np
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
+
+import scripter
+import renderer
+import loader
+from settings import MIDIS_PATH, PACK_NAME, HELP_CLIP_FORMATS
+from packindex import packNotes
+from benchmarks.suite import useScratch, clipScore, environment, Suite
+
+
+def readFrames(path: str):
+    reader = FFMPEG_VideoReader(path)
+    try:
+        for _ in range(reader.nframes):
+            yield reader.read_frame()
+    finally:
+        reader.close()
+
+def psnr(path: str, reference: str) -> float:
+    """PSNR of a clip against the same clip in another format [dB], inf when they are equal."""
+    error = 0.0
+    count = 0
+    for frame, reference_frame in zip(readFrames(path), readFrames(reference)):
+        error += np.mean((frame.astype(np.float64) - reference_frame.astype(np.float64)) ** 2)
+        count += 1
+    if count == 0 or error == 0: return float("inf")
+    return 10 * np.log10(255 ** 2 / (error / count))
+
+def resetLoader():
+    """Closes every clip the loader has open and forgets every clip info, so a song never sees the clips of the one before."""
+    if loader.clip_cache != None:
+        for path in list(loader.clip_cache.clips):
+            loader.clip_cache.forget(path)
+    loader.clip_infos.clear()
+
+def benchFormat(song: str, name: str, scratch: str, blocks: list, chunks: list) -> dict:
+    resetLoader()
+    renderer.help_clips_path = join(scratch, song, name)
+    renderer.HELP_CLIP_FORMAT = name
+    os.makedirs(renderer.help_clips_path, exist_ok=True)
+
+    start = perf_counter()
+    for block in blocks:
+        renderer.renderClip(block)
+    for chunk in chunks:
+        renderer.renderScriptClip(chunk)
+    encode = perf_counter() - start
+
+    paths = [join(renderer.help_clips_path, "Y"+str(chunk["index"])+".mp4") for chunk in chunks]
+    start = perf_counter()
+    frames = sum(1 for path in paths for _ in readFrames(path))
+    decode = perf_counter() - start
+
+    files = [join(renderer.help_clips_path, f) for f in listdir(renderer.help_clips_path) if f.endswith(".mp4")]
+    return {"format": name, "encode": encode, "decode": decode, "frames": frames, "decode_fps": frames / decode if decode > 0 else 0,
+            "bytes": sum(getsize(f) for f in files), "paths": paths}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compares the help clip formats.")
+    parser.add_argument("--out", default="help_clips.json", help="where the JSON results go")
+    parser.add_argument("--seconds", type=float, default=10, help="seconds of every song that are rendered")
+    parser.add_argument("--formats", nargs="+", default=list(HELP_CLIP_FORMATS), help="formats to compare")
+    args = parser.parse_args(argv)
+    formats = ["raw"] + [name for name in args.formats if name != "raw"] #The reference goes first
+
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        useScratch(scratch)
+        suite = Suite(scratch, seconds=args.seconds)
+        supported = set(packNotes(PACK_NAME))
+        for file in sorted(listdir(MIDIS_PATH), key=str.lower):
+            if file[-4:] != ".mid": continue
+            song = file[:-4]
+            script = [x for x in clipScore(suite.convert(song, join(MIDIS_PATH, file)), args.seconds) if x["note"] in supported]
+            if script == []: continue
+            _, optimised, blocks = scripter.optimizeScript(script, PACK_NAME)
+            chunks, _ = scripter.splitLoad(optimised, blocks, PACK_NAME)
+
+            reference = None
+            for name in formats:
+                result = benchFormat(song, name, scratch, blocks, chunks)
+                paths = result.pop("paths")
+                if reference == None: reference = paths
+                result["psnr"] = min((psnr(path, ref) for path, ref in zip(paths, reference)), default=float("inf"))
+                result["song"] = song
+                results.append(result)
+                print(f"{song:<24} {name:<10} encode {result['encode']:8.2f}s  decode {result['decode']:8.2f}s ({result['decode_fps']:7.1f} fps)"
+                      f"  {result['bytes']/1024**2:9.1f} MB  PSNR {result['psnr']:6.1f} dB")
+
+    with open(args.out, "w", encoding="utf-8") as file:
+        file.write(json.dumps({"environment": environment(), "settings": vars(args), "results": results}, indent=1))
+    print(f"Results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Micro-benchmark of the scripter note helpers.
+
+Run from the repository root:  python -m benchmarks.note_helpers
+
+Compares the old exchange sort, which parsed note names with NOTE_LIST.index on every comparison,
+with the NOTE_TO_MIDI table and the integer pitches the scripter works on now.
+"""
+import random
+from timeit import timeit
+
+import scripter
+from settings import NOTE_LIST, MIDI_TO_NOTE, NOTE_TO_MIDI
+
+
+def legacyMidiValue(keyCode):
+    return int(keyCode[-1])*12+int(NOTE_LIST.index(keyCode.rstrip(keyCode[-1])))
+
+def legacySort(set):
+    set = list(set)
+    for x in range(0,len(set)):
+        for y in range(x+1,len(set)):
+            if (legacyMidiValue(set[x]) > legacyMidiValue(set[y])):
+                set[x], set[y] = set[y], set[x]
+    return set
+
+
+def main(repeat: int = 20000):
+    rng = random.Random(0)
+    names = MIDI_TO_NOTE[12:120] # single digit octaves, the only ones the old parser understood
+
+    print(f"{'notes':>6} {'legacy sort':>14} {'sort':>14} {'sorted pitches':>16}   [us per call]")
+    for size in (2, 3, 4, 6, 8, 10, 60):
+        chords = [rng.sample(names, size) for _ in range(64)]
+        pitch_chords = [[NOTE_TO_MIDI[note] for note in chord] for chord in chords]
+        assert all(legacySort(chord) == scripter.sort(chord) for chord in chords)
+
+        number = max(1, repeat // size)
+        legacy = timeit(lambda: [legacySort(chord) for chord in chords], number=number) / number / len(chords)
+        table = timeit(lambda: [scripter.sort(chord) for chord in chords], number=number) / number / len(chords)
+        pitches = timeit(lambda: [sorted(chord) for chord in pitch_chords], number=number) / number / len(chords)
+        print(f"{size:>6} {legacy*1e6:>14.2f} {table*1e6:>14.2f} {pitches*1e6:>16.2f}")
+
+    number = repeat * 10
+    legacy = timeit(lambda: legacyMidiValue("C#4"), number=number) / number
+    table = timeit(lambda: NOTE_TO_MIDI["C#4"], number=number) / number
+    print(f"note -> midi number: legacy {legacy*1e9:.0f} ns, table {table*1e9:.0f} ns")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark of the note-on/note-off pairing in mid_to_json_converter.
+
+Run from the repository root:  python -m benchmarks.pairing [number_of_events]
+
+Times reading, decoding and pairing of every midi in data/midis and of a synthetic midi with
+1M note events (sustained and overlapping notes on 16 channels). The old forward-scanning pairing
+is timed next to pairNotes on the bundled songs for comparison.
+"""
+import os
+import sys
+import random
+import tempfile
+from time import perf_counter
+from mido import MidiFile, MidiTrack, Message
+
+import mid_to_json_converter as mTj
+from settings import MIDIS_PATH
+
+
+def legacyPairNotes(note_actions):
+    # The pairing loop convert() used before pairNotes, kept here as the reference
+    pairs = []
+    index = 0
+    while True:
+        release_index = index + 1
+        while note_actions[release_index].note != note_actions[index].note or note_actions[release_index].channel != note_actions[index].channel:
+            release_index += 1
+        pairs.append((note_actions[index], note_actions[release_index].time - note_actions[index].time))
+
+        next_index = index + 1
+        while note_actions[next_index].state == False and next_index + 1 < len(note_actions):
+            next_index += 1
+        index = next_index
+        if index >= len(note_actions) - 1: break
+    return pairs
+
+
+def syntheticMidi(path: str, events: int, seed: int = 0):
+    """Writes a type 0 midi with `events` note_on/note_off messages of sustained, overlapping notes."""
+    rng = random.Random(seed)
+    actions = []
+    tick = 0
+    for _ in range(events // 2):
+        tick += rng.choice((0, 0, 30, 60, 120))
+        note = rng.randint(36, 96)
+        channel = rng.randint(0, 15)
+        actions.append((tick, 1, Message("note_on", channel=channel, note=note, velocity=64)))
+        actions.append((tick + rng.randint(60, 3840), 0, Message("note_off", channel=channel, note=note)))
+    actions.sort(key=lambda action: (action[0], action[1]))
+
+    track = MidiTrack()
+    last_tick = 0
+    for tick, _, message in actions:
+        track.append(message.copy(time=tick - last_tick))
+        last_tick = tick
+    midi_file = MidiFile(type=0)
+    midi_file.tracks.append(track)
+    midi_file.save(path)
+
+
+def timed(function, *args):
+    start = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - start
+
+
+def bench(path: str, legacy: bool):
+    messages, read_time = timed(lambda: list(mTj.readMessages(path)))
+    note_actions, decode_time = timed(mTj.decodeMessages, messages, mTj.channel_filter)
+    pairs, pair_time = timed(mTj.pairNotes, note_actions)
+    line = f"{os.path.basename(path):<24} {len(note_actions):>9} actions  read {read_time:8.3f}s  decode {decode_time:7.3f}s  pair {pair_time:7.3f}s"
+    if legacy:
+        legacy_pairs, legacy_time = timed(legacyPairNotes, note_actions)
+        same = [(p.time, d) for p, d in pairs] == [(p.time, d) for p, d in legacy_pairs]
+        line += f"  legacy pair {legacy_time:7.3f}s  same={same}"
+    print(line)
+
+
+def main(events: int = 1000000):
+    for file in sorted(os.listdir(MIDIS_PATH), key=str.lower):
+        if file[-4:] == ".mid": bench(os.path.join(MIDIS_PATH, file), legacy=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"synthetic_{events}.mid")
+        _, build_time = timed(syntheticMidi, path, events)
+        print(f"(synthetic midi written in {build_time:.1f}s)")
+        bench(path, legacy=False)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
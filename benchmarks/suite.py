@@ -0,0 +1,194 @@
+"""
+Throughput benchmark of the whole pipeline, one stage at a time.
+
+Run from the repository root:  python -m benchmarks.suite [--out results.json] [--compare old.json] [--profile draft]
+
+Times mid_to_json_converter.convert, scripter.optimizeScript, scripter.splitLoad, the audio mix and
+the render stages (X blocks, Y chunks, final composite, direct and streaming compositor) on the songs
+in data/midis and on synthetic scores of growing length and polyphony. Renders only cover the first
+--seconds of a song, the compositors write --size frames and the staged renderers use the render
+profile --profile (draft by default, so a run stays short). Everything is written to a scratch
+folder, data/ isn't touched. The results are printed and written as JSON; with --compare, stages
+that got slower than --tolerance against an older run are listed and the exit code is 1.
+"""
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+from time import perf_counter
+from os import listdir
+from os.path import join
+
+import mid_to_json_converter as mTj
+import score_io
+import scripter
+import renderer
+import compositor
+import renderprofile
+from settings import MIDIS_PATH, PACK_NAME, RENDER_PROFILES
+from score_io import readScore, scorePath
+from audio import mixScore, NoteBank
+from packindex import packNotes
+from benchmarks.pairing import syntheticMidi
+
+SYNTHETIC_LENGTHS = [500, 2000, 8000] #Notes of the synthetic scores
+SYNTHETIC_POLYPHONY = [1, 3, 6] #Notes per chord of the synthetic scores
+
+
+def useScratch(path: str):
+    """Points every stage that writes files at `path`, so a run doesn't overwrite the project's data."""
+    for folder in ["midis", "scores", "jsons", "scripts", "helpClips"]:
+        os.makedirs(join(path, folder), exist_ok=True)
+    mTj.MIDIS_PATH = join(path, "midis")
+    score_io.SCORES_PATH = join(path, "scores")
+    score_io.JSONS_PATH = join(path, "jsons")
+    scripter.scripts_path = join(path, "scripts")
+    renderer.help_clips_path = join(path, "helpClips")
+
+def syntheticScore(notes: int, polyphony: int, pack_notes: list, seed: int = 0) -> list:
+    """A score of `notes` pack notes in chords of `polyphony`, one chord every 0.125 to 0.5 s."""
+    rng = random.Random(seed)
+    script = []
+    time = 2.0
+    while len(script) < notes:
+        duration = rng.choice((0.25, 0.5, 1.0))
+        for note in rng.sample(pack_notes, min(polyphony, len(pack_notes), notes - len(script))):
+            script.append({"note": note, "instrument": 0, "time": time, "duration": duration})
+        time += rng.choice((0.125, 0.25, 0.5))
+    return script
+
+def clipScore(script, seconds: float) -> list:
+    """The notes of the first `seconds` of a song."""
+    if script == []: return script
+    start = min(x["time"] for x in script)
+    return [dict(x) for x in script if x["time"] < start + seconds]
+
+def timed(function, *args):
+    start = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - start
+
+
+class Suite:
+    def __init__(self, scratch: str, pack_name: str = PACK_NAME, size=(320, 180), seconds: float = 10, staged: bool = True):
+        self.scratch = scratch
+        self.pack_name = pack_name
+        self.size = tuple(size)
+        self.seconds = seconds
+        self.staged = staged
+        self.results = []
+
+    def record(self, song: str, stage: str, notes: int, wall: float, **extra):
+        result = dict({"song": song, "stage": stage, "notes": notes, "wall": wall, "notes_per_s": notes / wall if wall > 0 else 0}, **extra)
+        self.results.append(result)
+        print(f"{song:<28} {stage:<14} {notes:>7} notes {wall:>9.3f}s {result['notes_per_s']:>11.0f} notes/s")
+
+    def convert(self, song: str, midi_path: str) -> list:
+        shutil.copy(midi_path, join(mTj.MIDIS_PATH, song+".mid"))
+        _, wall = timed(mTj.convert, song)
+        script = readScore(scorePath(song)).toDicts()
+        self.record(song, "convert", len(script), wall)
+        return script
+
+    def score(self, song: str, script: list):
+        """optimizeScript and splitLoad on the whole song, the audio mix and renders on its first seconds."""
+        supported = set(packNotes(self.pack_name))
+        script = [x for x in script if x["note"] in supported] #checkScript would ask to transpose
+        if script == []: return
+
+        (_, optimised, blocks), wall = timed(scripter.optimizeScript, [dict(x) for x in script], self.pack_name)
+        self.record(song, "optimize", len(script), wall, entries=len(optimised), blocks=len(blocks))
+        (chunks, _), wall = timed(scripter.splitLoad, [dict(x) for x in optimised], blocks, self.pack_name)
+        self.record(song, "split", len(optimised), wall, chunks=len(chunks))
+        _, wall = timed(mixScore, optimised, blocks, self.pack_name, NoteBank())
+        self.record(song, "audio mix", len(optimised), wall)
+
+        if self.seconds > 0: self.render(song, clipScore(script, self.seconds))
+
+    def render(self, song: str, script: list):
+        _, optimised, blocks = scripter.optimizeScript(script, self.pack_name)
+        out_path = join(self.scratch, "movie.mp4")
+
+        stats, wall = timed(compositor.renderDirect, optimised, blocks, out_path, self.pack_name, self.size)
+        self.record(song, "direct render", len(optimised), wall, frames=stats.get("frames", 0), fps=stats.get("frames", 0) / wall)
+        stats, wall = timed(compositor.renderStream, optimised, blocks, out_path, self.pack_name, self.size)
+        self.record(song, "stream render", len(optimised), wall, frames=stats.get("frames", 0), fps=stats.get("frames", 0) / wall, peak_memory=stats.get("peak_memory"))
+        if not self.staged: return
+
+        chunks, final_script = scripter.splitLoad([dict(x) for x in optimised], blocks, self.pack_name)
+        _, wall = timed(lambda: [renderer.renderClip(block) for block in blocks])
+        self.record(song, "block render", len(blocks), wall)
+        _, wall = timed(lambda: [renderer.renderScriptClip(chunk) for chunk in chunks])
+        self.record(song, "script render", len(optimised), wall)
+        _, wall = timed(renderer.renderFinal, final_script, None, 1, out_path)
+        self.record(song, "final render", len(final_script), wall)
+
+    def run(self, midis_path: str = MIDIS_PATH):
+        for file in sorted(listdir(midis_path), key=str.lower):
+            if file[-4:] == ".mid": self.score(file[:-4], self.convert(file[:-4], join(midis_path, file)))
+
+        for notes in SYNTHETIC_LENGTHS:
+            midi_path = join(self.scratch, "synthetic.mid")
+            syntheticMidi(midi_path, notes * 2)
+            self.convert(f"synthetic_{notes}", midi_path)
+
+        pack_notes = packNotes(self.pack_name)
+        for polyphony in SYNTHETIC_POLYPHONY:
+            for notes in SYNTHETIC_LENGTHS:
+                self.score(f"synthetic_{notes}x{polyphony}", syntheticScore(notes, polyphony, pack_notes))
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+def compare(results: list, old_results: list, tolerance: float) -> list:
+    """(song, stage, old wall, new wall) of every stage that got slower than tolerance allows."""
+    old = {(result["song"], result["stage"]): result["wall"] for result in old_results}
+    slower = []
+    for result in results:
+        before = old.get((result["song"], result["stage"]))
+        if before != None and result["wall"] > before * (1 + tolerance):
+            slower.append((result["song"], result["stage"], before, result["wall"]))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Times every stage of the pipeline.")
+    parser.add_argument("--out", default="bench_results.json", help="where the JSON results go")
+    parser.add_argument("--compare", default=None, help="results of an earlier run to check against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against --compare, 0.2 = 20%%")
+    parser.add_argument("--seconds", type=float, default=10, help="seconds of every song that are rendered, 0 for no renders")
+    parser.add_argument("--size", type=int, nargs=2, default=[320, 180], help="frame size of the compositor renders")
+    parser.add_argument("--profile", default="draft", choices=list(RENDER_PROFILES), help="render profile of the X/Y/final renders")
+    parser.add_argument("--no-staged", action="store_true", help="leave out the X/Y/final renders")
+    args = parser.parse_args(argv)
+
+    renderprofile.useProfile(args.profile)
+    with tempfile.TemporaryDirectory() as scratch:
+        useScratch(scratch)
+        suite = Suite(scratch, size=args.size, seconds=args.seconds, staged=not args.no_staged)
+        suite.run()
+
+    with open(args.out, "w", encoding="utf-8") as file:
+        file.write(json.dumps({"environment": environment(), "settings": vars(args), "results": suite.results}, indent=1))
+    print(f"Results written to {args.out}")
+
+    if args.compare != None:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            slower = compare(suite.results, json.load(file)["results"], args.tolerance)
+        for song, stage, before, after in slower:
+            print(f"SLOWER: {song} {stage} {before:.3f}s -> {after:.3f}s")
+        if slower: return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import numpy as np
+
+kernels = {} #Per process, frame size -> BlendKernel, see blendKernel
+
+
+def rampOpacity(i: int, n: int) -> float:
+    """Opacity of note i of an n note block, the ramp renderClip has always used."""
+    return (1/n)*(n-i)
+
+
+class BlendKernel:
+    """
+    Lays N frames over black with given opacities, bottom first, with the same arithmetic as
+    CompositeVideoClip: every layer is opacity * source + (1 - opacity) * below in float64 and the
+    result is truncated to whole levels before the next layer, so the output is bit for bit what
+    moviepy gives. Unlike moviepy nothing is allocated per layer or per frame: the accumulator and
+    the scratch buffer are made once and every step works in place on them. A frame smaller than
+    the kernel only changes its top left corner, like a blit; a bigger one is cropped.
+    """
+    def __init__(self, size):
+        self.size = tuple(size)
+        self.accumulator = np.empty((self.size[1], self.size[0], 3), dtype=np.float64)
+        self.scratch = np.empty_like(self.accumulator)
+        self.out = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+
+    def blend(self, frames: list, opacities: list) -> np.ndarray:
+        """The blended frame as uint8. It is overwritten by the next call."""
+        self.accumulator[:] = 0
+        for frame, opacity in zip(frames, opacities):
+            h = min(frame.shape[0], self.size[1])
+            w = min(frame.shape[1], self.size[0])
+            below = self.accumulator[:h, :w]
+            layer = self.scratch[:h, :w]
+            np.multiply(frame[:h, :w, :3], opacity, out=layer)
+            below *= 1.0 - opacity
+            below += layer
+            np.floor(below, out=below) #moviepy's astype('uint8') after every blit
+        np.copyto(self.out, self.accumulator, casting="unsafe")
+        return self.out
+
+def blendKernel(size) -> BlendKernel:
+    """The kernel of this process for a frame size, made once and reused by every block."""
+    size = tuple(size)
+    if size not in kernels: kernels[size] = BlendKernel(size)
+    return kernels[size]
+
+def blendRamp(clips: list, t: float, size) -> np.ndarray:
+    """The frame at t of a block of clips blended with the opacity ramp, clips that already ended are left out."""
+    playing = [i for i, clip in enumerate(clips) if t < clip.duration]
+    return blendKernel(size).blend([clips[i].get_frame(t) for i in playing], [rampOpacity(i, len(clips)) for i in playing])
@@ -0,0 +1,102 @@
+import os
+import json
+import time
+from os.path import join, exists
+from settings import *
+from history import digest, place, renderSettings
+from hashing import fileHash
+from packindex import isPack, noteEntry
+
+index_name = "index.json" # kept in BLOCK_CACHE_PATH
+
+
+class BlockCache:
+    """
+    Rendered X blocks shared by all songs, stored under BLOCK_CACHE_PATH as <key>.mp4. The key is a
+    hash of the content of the pack clips in blend order, the blend and the render settings, so the
+    same chord is rendered once no matter which song or block index it comes from. The least
+    recently used blocks are dropped when the cache grows over BLOCK_CACHE_SIZE bytes.
+    """
+    def __init__(self, path: str = BLOCK_CACHE_PATH, max_size: int = BLOCK_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.entries = {} # key -> {"size", "used"}
+        self.files = {} # pack clip -> [size, mtime, sha256], so clips are only hashed again when they change
+        self.hits = 0
+        self.misses = 0
+        self.run_hits = 0
+        self.run_misses = 0
+        if exists(join(path, index_name)):
+            with open(join(path, index_name), "r", encoding="utf-8") as file:
+                index = json.loads(file.read())
+            self.entries = index["entries"]
+            self.files = index["files"]
+            self.hits = index["hits"]
+            self.misses = index["misses"]
+
+    def noteHash(self, pack_name: str, note: str) -> str:
+        entry = noteEntry(pack_name, note) if isPack(pack_name) else None
+        if entry != None: return entry["sha256"]
+        path = join(pack_name, note+".mp4")
+        stat = os.stat(path)
+        entry = self.files.get(path)
+        if entry == None or entry[0] != stat.st_size or entry[1] != stat.st_mtime:
+            entry = [stat.st_size, stat.st_mtime, fileHash(path)]
+            self.files[path] = entry
+        return entry[2]
+
+    def key(self, block) -> str:
+        return digest({"notes": [self.noteHash(block["pack_name"], note) for note in block["notes"]], "blend": "ramp", "settings": renderSettings()})
+
+    def restore(self, blocks) -> list:
+        """Puts the cached blocks into help_clips_path. Returns the blocks that still have to be rendered."""
+        if not exists(help_clips_path): os.makedirs(help_clips_path)
+        missing = []
+        for block in blocks:
+            key = self.key(block)
+            if key in self.entries and exists(join(self.path, key+".mp4")):
+                place(join(self.path, key+".mp4"), join(help_clips_path, "X"+str(block["index"])+".mp4"))
+                self.entries[key]["used"] = time.time()
+                self.run_hits += 1
+            else:
+                destination = join(help_clips_path, "X"+str(block["index"])+".mp4")
+                if exists(destination): os.remove(destination) #May be a link into the cache or a history
+                missing.append(block)
+                self.run_misses += 1
+        self.hits += len(blocks) - len(missing)
+        self.misses += len(missing)
+        self.save()
+        print(f"Block cache: {len(blocks) - len(missing)} hits, {len(missing)} misses")
+        return missing
+
+    def store(self, blocks):
+        """Adds rendered blocks to the cache and evicts the least recently used ones over the size limit."""
+        if not exists(self.path): os.makedirs(self.path)
+        for block in blocks:
+            source = join(help_clips_path, "X"+str(block["index"])+".mp4")
+            if not exists(source): continue
+            key = self.key(block)
+            place(source, join(self.path, key+".mp4"))
+            self.entries[key] = {"size": os.path.getsize(source), "used": time.time()}
+
+        size = sum(entry["size"] for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda key: self.entries[key]["used"]):
+            if size <= self.max_size: break
+            size -= self.entries.pop(key)["size"]
+            if exists(join(self.path, key+".mp4")): os.remove(join(self.path, key+".mp4"))
+        self.save()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "run_hits": self.run_hits, "run_misses": self.run_misses,
+                "entries": len(self.entries), "size": sum(entry["size"] for entry in self.entries.values())}
+
+    def save(self):
+        if not exists(self.path): os.makedirs(self.path)
+        with open(join(self.path, index_name), "w", encoding="utf-8") as file:
+            file.write(json.dumps({"hits": self.hits, "misses": self.misses, "files": self.files, "entries": self.entries}).replace("},", "},\n"))
+
+
+if __name__ == '__main__':
+    print(json.dumps(BlockCache().stats(), indent=4))
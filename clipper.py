@@ -1,26 +1,89 @@
-import json
 import gc
+import os
+from contextlib import nullcontext
 from settings import *
+from score_io import findScore, readScore
+from framestore import buildFrameStore
+from proxy import buildProxies
+from compositor import renderDirect, renderStream
 from renderer import *
+from scheduler import RenderScheduler
+from history import RenderHistory
+from blockcache import BlockCache
+from audio import renderTrack
+from profiler import RenderTrace
+from renderprofile import useProfile, renderSize
+from mid_to_json_converter import convert
 from scripter import *
 
 
-def main(filename: str):
+def main(filename: str, project: str = None, profile: str = RENDER_PROFILE):
     gc.enable()
+    profile = useProfile(profile) # Before the pool starts, the workers get it through initClipCache
+    out_path = profile["output"]
 
-    script = json.load(open(JSONS_PATH+"/"+filename+".json"))
+    trace = RenderTrace(project or filename) if TRACE_RENDER else None
+    stage = trace.stage if trace != None else lambda name: nullcontext({})
 
-    script = checkScript(script, PACK_NAME)
+    with stage("convert"):
+        if findScore(filename) == None: convert(filename)
+        script = readScore(findScore(filename)).toDicts()
 
-    _, script, blocks = optimizeScript(script, PACK_NAME)
+    with stage("check"):
+        script = checkScript(script, PACK_NAME)
 
-    script_list, final_script = splitLoad(script)
+    # One pool for the whole run, the direct render doesn't need one
+    # The streaming render decodes through its own pipes and never reads the frame store, it uses the proxies
+    frame_store = USE_FRAME_STORE and tuple(FRAME_STORE_SIZE) == renderSize() and not (DIRECT_RENDER and STREAM_RENDER)
+    scheduler = RenderScheduler() if not profile["audio_only"] and (frame_store or not DIRECT_RENDER) else None
+    try:
+        with stage("optimize"):
+            _, script, blocks = optimizeScript(script, PACK_NAME)
 
-    renderBlockClips(BATCH_SIZE, blocks)
+        if profile["audio_only"]:
+            with stage("final render") as record:
+                renderTrack(script, blocks, out_path, PACK_NAME)
+                if os.path.exists(out_path): record["bytes_written"] = os.path.getsize(out_path)
+            return
 
-    renderScriptClips(BATCH_SIZE, script_list)
+        if frame_store:
+            with stage("frame store"): buildFrameStore(PACK_NAME, FRAME_STORE_SIZE, pool=scheduler.pool)
+        elif USE_PROXIES:
+            with stage("proxies"): buildProxies(PACK_NAME, pool=scheduler.pool if scheduler != None else None)
 
-    renderFinal(final_script)
+        if DIRECT_RENDER:
+            with stage("final render") as record:
+                if STREAM_RENDER: record.update(renderStream(script, blocks, out_path, PACK_NAME))
+                else: record.update(renderDirect(script, blocks, out_path, PACK_NAME))
+                if os.path.exists(out_path): record["bytes_written"] = os.path.getsize(out_path)
+            return
+
+        with stage("split"):
+            script_list, final_script = splitLoad(script, blocks, PACK_NAME)
+
+        # Only what changed since the last render of the project
+        history = RenderHistory(project or filename) if INCREMENTAL_RENDER else None
+        render_blocks, render_chunks = history.reuse(blocks, script_list, PACK_NAME) if history != None else (blocks, script_list)
+
+        # Chords rendered for any song before
+        block_cache = BlockCache() if BLOCK_CACHE else None
+        if block_cache != None: render_blocks = block_cache.restore(render_blocks)
+
+        with stage("help clips"):
+            scheduler.renderHelpClips(render_blocks, render_chunks, trace)
+
+        if block_cache != None: block_cache.store(render_blocks)
+
+        if history != None: history.save()
+
+        with stage("final render") as record:
+            audio_path = renderTrack(script, blocks, help_clips_path+"/movie_audio.m4a", PACK_NAME) if AUDIO_ENGINE else None
+
+            renderFinal(final_script, scheduler.pool, scheduler.processes, out_path, audio_path, trace)
+            if os.path.exists(out_path): record["bytes_written"] = os.path.getsize(out_path)
+    finally:
+        if scheduler != None: scheduler.close()
+        if trace != None: trace.save()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,162 @@
+import os
+import gc
+import numpy as np
+import moviepy.editor as mp
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from settings import *
+from loader import getClip, clipInfo, StreamReader
+from timeline import TimelineIndex
+from audio import renderTrack
+from profiler import peakMemory, resetPeakMemory
+from blend import blendRamp
+from renderprofile import renderProfile, renderSize, renderFps
+
+
+class Layer:
+    """One entry of the optimised script on the timeline: a single note or a block of notes blended together."""
+    __slots__ = ("start", "end", "notes", "clips")
+
+    def __init__(self, start: float, notes: list, clips: list):
+        self.start = start
+        self.end = start + max(clip.duration for clip in clips)
+        self.notes = notes
+        self.clips = clips
+
+def buildLayers(script, blocks, pack_name: str = PACK_NAME) -> list:
+    """Resolves every script entry to its pack clips, X entries to the notes of their block. Keeps script order, later layers are on top."""
+    layers = []
+    for entry in script:
+        if entry["note"][0] == 'X': notes = blocks[int(entry["note"][1:])]["notes"]
+        else: notes = [entry["note"]]
+        layers.append(Layer(entry["time"], notes, [getClip(pack_name, note) for note in notes]))
+    return layers
+
+def paste(frame, source):
+    """Puts a source frame in the top left corner of the output frame, like CompositeVideoClip does."""
+    h = min(frame.shape[0], source.shape[0])
+    w = min(frame.shape[1], source.shape[1])
+    frame[:h, :w] = source[:h, :w]
+
+def layerFrame(layer: Layer, t: float, size):
+    """
+    The frame of a layer at song time t. A block is blended like renderClip does it: notes are laid
+    over black in order, note i with opacity (n-i)/n, and a note that already ended is left out.
+    """
+    local_t = t - layer.start
+    if len(layer.clips) == 1: return layer.clips[0].get_frame(local_t)
+    return blendRamp(layer.clips, local_t, size)
+
+def covers(layer: Layer, size) -> bool:
+    """Blocks are rendered at full size, single notes cover the frame when the clip is as big as it."""
+    return len(layer.clips) > 1 or tuple(layer.clips[0].size) == tuple(size)
+
+def composeFrame(active: list, t: float, size, frame):
+    """
+    Draws the active layers (bottom to top) into `frame`. Layers under the topmost one that covers
+    the whole frame can't be seen, so they aren't decoded at all.
+    """
+    first = None
+    for i in range(len(active) - 1, -1, -1):
+        if covers(active[i], size):
+            first = i
+            break
+    if first == None:
+        frame[:] = 0
+        first = 0
+
+    for layer in active[first:]:
+        paste(frame, layerFrame(layer, t, size))
+    return frame
+
+def renderAudio(layers: list, path: str, fps: int = 44100):
+    tracks = []
+    for layer in layers:
+        for clip in layer.clips:
+            if clip.audio != None: tracks.append(clip.audio.set_start(layer.start))
+    if tracks == []: return None
+    mp.CompositeAudioClip(tracks).write_audiofile(path, fps=fps, codec="aac", verbose=False, logger=None)
+    return path
+
+def renderDirect(script, blocks, out_path: str = "movie.mp4", pack_name: str = PACK_NAME, size=None, fps: float = None) -> dict:
+    """
+    Renders the movie straight from the optimised script in one pass, instead of the X blocks, Y
+    chunks and final composite. For every output frame the active layers are found, blended with
+    numpy and the raw frame is piped to a single ffmpeg encoder. Nothing is encoded twice. Size and
+    fps default to the render profile. Returns the number of frames written.
+    """
+    layers = buildLayers(script, blocks, pack_name)
+    if layers == []: return {}
+    if size == None: size = renderSize()
+    if fps == None: fps = renderFps(layers[0].clips[0].fps)
+    end = max(layer.end for layer in layers)
+
+    audio_path = os.path.splitext(out_path)[0] + "TEMP_audio.m4a"
+    audio_path = renderTrack(script, blocks, audio_path, pack_name) if AUDIO_ENGINE else renderAudio(layers, audio_path)
+
+    index = TimelineIndex([layer.start for layer in layers], [layer.end for layer in layers])
+    times = [k / fps for k in range(int(np.ceil(end * fps)))]
+
+    writer = FFMPEG_VideoWriter(out_path, size, fps, codec="libx264", preset=renderProfile()["preset"], audiofile=audio_path)
+    frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    for t, active in zip(times, index.sweep(times)):
+        writer.write_frame(composeFrame([layers[i] for i in active], t, size, frame))
+    writer.close()
+
+    if audio_path != None and not KEEP_TMPS: os.remove(audio_path)
+    gc.collect()
+    return {"frames": len(times)}
+
+def renderStream(script, blocks, out_path: str = "movie.mp4", pack_name: str = PACK_NAME, size=None, fps: float = None) -> dict:
+    """
+    Renders like renderDirect, but a note is only open while it plays: its reader is started when
+    the note starts and closed when it ends, and every occurrence decodes front to back without
+    seeking. The frames go from the generator straight into the ffmpeg pipe, so memory depends on
+    how many notes sound at once and not on the length of the song. The audio is mixed block by
+    block the same way (renderTrack). Returns the peak memory of the render and the most readers
+    that were open at once.
+    """
+    measured = resetPeakMemory()
+    entries = []
+    for entry in script:
+        notes = blocks[int(entry["note"][1:])]["notes"] if entry["note"][0] == 'X' else [entry["note"]]
+        entries.append((entry["time"], entry["time"] + max(clipInfo(pack_name, note)["duration"] for note in notes), notes))
+    if entries == []: return {}
+    if size == None: size = renderSize()
+    if fps == None: fps = renderFps(clipInfo(pack_name, entries[0][2][0])["fps"])
+    end = max(entry[1] for entry in entries)
+
+    audio_path = os.path.splitext(out_path)[0] + "TEMP_audio.m4a"
+    audio_path = renderTrack(script, blocks, audio_path, pack_name)
+
+    index = TimelineIndex([entry[0] for entry in entries], [entry[1] for entry in entries])
+    stats = {"frames": 0, "peak_readers": 0, "peak_memory": None, "peak_memory_scope": "render" if measured else "process"}
+
+    def frames():
+        frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        open_layers = {} #Script position -> Layer of StreamReaders
+        frame_count = int(np.ceil(end * fps))
+        times = (k / fps for k in range(frame_count))
+        for t, active in zip(times, index.sweep(k / fps for k in range(frame_count))):
+            playing = set(active)
+            for position in [position for position in open_layers if position not in playing]:
+                for reader in open_layers.pop(position).clips: reader.close()
+            for position in active:
+                if position not in open_layers:
+                    start, _, notes = entries[position]
+                    open_layers[position] = Layer(start, notes, [StreamReader(pack_name, note) for note in notes])
+            stats["peak_readers"] = max(stats["peak_readers"], sum(len(layer.clips) for layer in open_layers.values()))
+            stats["frames"] += 1
+            yield composeFrame([open_layers[i] for i in active], t, size, frame)
+        for layer in open_layers.values():
+            for reader in layer.clips: reader.close()
+
+    writer = FFMPEG_VideoWriter(out_path, size, fps, codec="libx264", preset=renderProfile()["preset"], audiofile=audio_path)
+    for frame in frames():
+        writer.write_frame(frame)
+    writer.close()
+
+    if audio_path != None and not KEEP_TMPS: os.remove(audio_path)
+    gc.collect()
+    stats["peak_memory"] = peakMemory()
+    if stats["peak_memory"] != None: print(f"Peak memory ({stats['peak_memory_scope']}): {stats['peak_memory'] / 1024**2:.0f} MB, at most {stats['peak_readers']} note readers open")
+    return stats
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import multiprocessing
+import numpy as np
+import moviepy.editor as mp
+from os import listdir
+from os.path import isfile, join, basename, normpath
+from settings import *
+
+
+def frameStorePath(pack_name: str, size=FRAME_STORE_SIZE) -> str:
+    """Folder of the decoded frames of a pack at one resolution, e.g. data/frames/PianoTestPack/1920x1080."""
+    return join(FRAME_STORE_PATH, basename(normpath(pack_name)), str(size[0])+"x"+str(size[1]))
+
+def readMeta(store_path: str) -> dict:
+    meta_path = join(store_path, "meta.json")
+    if not os.path.exists(meta_path): return {}
+    with open(meta_path, "r", encoding="utf-8") as file:
+        return json.loads(file.read())
+
+def decodeNote(job):
+    """Pool task of buildFrameStore: decodes every frame of one note clip into <note>.npy."""
+    pack_name, note, size = job
+    store_path = frameStorePath(pack_name, size)
+    source = join(pack_name, note+".mp4")
+
+    clip = mp.VideoFileClip(source, audio=False, target_resolution=(size[1], size[0]))
+    count = len(np.arange(0, clip.duration, 1.0/clip.fps)) #Same frames as iter_frames
+    tmp_path = join(store_path, note+".tmp.npy")
+    frames = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=(count, size[1], size[0], 3))
+    for i, frame in enumerate(clip.iter_frames(dtype="uint8")):
+        if i >= count: break
+        frames[i] = frame
+    frames.flush()
+    del frames
+    os.replace(tmp_path, join(store_path, note+".npy"))
+
+    stat = os.stat(source)
+    entry = {"fps": clip.fps, "duration": clip.duration, "frames": count, "size": stat.st_size, "mtime": stat.st_mtime}
+    clip.close()
+    return note, entry
+
+def buildFrameStore(pack_name: str = PACK_NAME, size=FRAME_STORE_SIZE, processes: int = None, pool=None) -> str:
+    """
+    Decodes every note clip of a pack once into memory-mappable .npy frames at `size`. Notes whose
+    clip didn't change since the last build are skipped. Runs on `pool` if one is given. Returns the store folder.
+    """
+    size = tuple(size)
+    store_path = frameStorePath(pack_name, size)
+    if not os.path.exists(store_path): os.makedirs(store_path)
+
+    meta = readMeta(store_path)
+    jobs = []
+    for f in sorted(listdir(pack_name)):
+        if not (isfile(join(pack_name, f)) and f.endswith(".mp4")): continue
+        note = f.replace(".mp4","")
+        stat = os.stat(join(pack_name, f))
+        entry = meta.get(note)
+        if entry != None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime and os.path.exists(join(store_path, note+".npy")): continue
+        jobs.append((pack_name, note, size))
+
+    if jobs:
+        print(f"Decoding {len(jobs)} clips of {pack_name} at {size[0]}x{size[1]} …")
+        if pool != None:
+            for note, entry in pool.imap_unordered(decodeNote, jobs):
+                meta[note] = entry
+        else:
+            with multiprocessing.Pool(processes=processes) as pool:
+                for note, entry in pool.imap_unordered(decodeNote, jobs):
+                    meta[note] = entry
+        with open(join(store_path, "meta.json"), "w", encoding="utf-8") as file:
+            file.write(json.dumps(meta).replace("},", "},\n"))
+
+    return store_path
+
+def hasStoredFrames(pack_name: str, note: str, size=FRAME_STORE_SIZE) -> bool:
+    return os.path.exists(join(frameStorePath(pack_name, size), note+".npy"))
+
+def loadStoredClip(pack_name: str, note: str, size=FRAME_STORE_SIZE):
+    """
+    A clip of a pack note that reads its frames straight from the memory-mapped store. The frames
+    aren't copied: every worker maps the same file and the OS shares the pages between them. The
+    audio still comes from the original clip.
+    """
+    store_path = frameStorePath(pack_name, size)
+    entry = readMeta(store_path)[note]
+    frames = np.load(join(store_path, note+".npy"), mmap_mode="r")
+    fps = entry["fps"]
+    last = len(frames) - 1
+
+    clip = mp.VideoClip(lambda t: frames[min(int(fps*t + 0.00001), last)], duration=entry["duration"])
+    clip.fps = fps
+    clip.filename = join(pack_name, note+".mp4")
+    clip.frames = frames
+    clip.audio = mp.AudioFileClip(clip.filename)
+    return clip
+
+
+if __name__ == '__main__':
+    # python framestore.py [pack folder] [width height]
+    pack_name = sys.argv[1] if len(sys.argv) > 1 else PACK_NAME
+    size = (int(sys.argv[2]), int(sys.argv[3])) if len(sys.argv) > 3 else FRAME_STORE_SIZE
+    print(buildFrameStore(pack_name, size))
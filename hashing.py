@@ -0,0 +1,10 @@
+import hashlib
+
+
+def fileHash(path: str) -> str:
+    """SHA-256 of a file, read in 1 MB blocks."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
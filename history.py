@@ -0,0 +1,100 @@
+import os
+import json
+import shutil
+import hashlib
+from os.path import join, exists
+from settings import *
+from packindex import isPack, noteEntry
+from renderprofile import renderProfile, renderSize
+
+manifest_name = "renders.json" # kept in the project folder, help clip name -> fingerprint
+
+
+def renderSettings() -> dict:
+    """Everything besides the notes that changes how a help clip comes out, part of every fingerprint."""
+    return {"size": list(renderSize()), "fps": renderProfile()["fps"], "preset": renderProfile()["preset"], "frame_store": USE_FRAME_STORE,
+            "frame_store_size": list(FRAME_STORE_SIZE), "audio": not AUDIO_ENGINE, "proxies": USE_PROXIES,
+            "help_clip_format": HELP_CLIP_FORMATS[HELP_CLIP_FORMAT]}
+
+def digest(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+def noteStamp(pack_name: str, note: str) -> list:
+    entry = noteEntry(pack_name, note) if isPack(pack_name) else None
+    if entry != None: return [note, entry["bytes"], entry["mtime"]]
+    stat = os.stat(join(pack_name, note+".mp4"))
+    return [note, stat.st_size, stat.st_mtime]
+
+def blockFingerprint(block) -> str:
+    """An X block is its pack notes in blend order, the index doesn't matter."""
+    return digest({"pack": block["pack_name"], "notes": [noteStamp(block["pack_name"], note) for note in block["notes"]], "settings": renderSettings()})
+
+def chunkFingerprint(chunk, block_prints: dict, pack_name: str = PACK_NAME) -> str:
+    """
+    A Y chunk is its entries and tails at times relative to the chunk start. X entries stand for the
+    fingerprint of their block, so renumbered blocks don't change the chunks that use them.
+    """
+    def entry(y):
+        if y["note"][0] == 'X': return [block_prints[int(y["note"][1:])], y["time"] - chunk["time"]]
+        return [noteStamp(pack_name, y["note"]), y["time"] - chunk["time"]]
+    return digest({"pack": pack_name, "script": [entry(y) for y in chunk["script"]], "tails": [entry(y) for y in chunk["tails"]],
+                   "span": chunk["end"] - chunk["time"], "settings": renderSettings()})
+
+def place(source: str, destination: str):
+    """Hard links (or copies) a clip. The destination is unlinked first, so writing it later never touches the source."""
+    if exists(destination): os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class RenderHistory:
+    """
+    The help clips of the last render of a project, kept in data/history/<project>/helpClips and
+    named by the fingerprint of what went into them. Blocks and chunks whose fingerprint is there
+    are restored instead of rendered again.
+    """
+    def __init__(self, project: str):
+        self.path = join(HISTORY_PATH, project)
+        self.clips_path = join(self.path, "helpClips")
+        self.manifest = {}
+        self.prints = {}
+        if exists(join(self.path, manifest_name)):
+            with open(join(self.path, manifest_name), "r", encoding="utf-8") as file:
+                self.manifest = json.loads(file.read())
+
+    def reuse(self, blocks, chunks, pack_name: str = PACK_NAME):
+        """Restores the unchanged help clips into help_clips_path. Returns the blocks and chunks that still have to be rendered."""
+        block_prints = {block["index"]: blockFingerprint(block) for block in blocks}
+        self.prints = {"X"+str(index): fingerprint for index, fingerprint in block_prints.items()}
+        for chunk in chunks:
+            self.prints["Y"+str(chunk["index"])] = chunkFingerprint(chunk, block_prints, pack_name)
+
+        if not exists(help_clips_path): os.makedirs(help_clips_path)
+        old_names = {fingerprint: name for name, fingerprint in self.manifest.items()}
+        reused = set()
+        for name, fingerprint in self.prints.items():
+            destination = join(help_clips_path, name+".mp4")
+            old = old_names.get(fingerprint)
+            if old != None and exists(join(self.clips_path, old+".mp4")):
+                place(join(self.clips_path, old+".mp4"), destination)
+                reused.add(name)
+            elif exists(destination):
+                os.remove(destination) #May be a link into the history
+
+        print(f"Reusing {len(reused)} of {len(self.prints)} help clips from {self.path}")
+        return ([block for block in blocks if "X"+str(block["index"]) not in reused],
+                [chunk for chunk in chunks if "Y"+str(chunk["index"]) not in reused])
+
+    def save(self):
+        """Keeps the help clips of this render as the project's history, dropping the ones nothing uses anymore."""
+        if not exists(self.clips_path): os.makedirs(self.clips_path)
+        for name in self.prints:
+            place(join(help_clips_path, name+".mp4"), join(self.clips_path, name+".mp4"))
+        for f in os.listdir(self.clips_path):
+            if f.endswith(".mp4") and f.replace(".mp4","") not in self.prints: os.remove(join(self.clips_path, f))
+
+        self.manifest = dict(self.prints)
+        with open(join(self.path, manifest_name), "w", encoding="utf-8") as file:
+            file.write(json.dumps(self.manifest).replace(", ", ",\n"))
@@ -1,10 +1,22 @@
+import subprocess
+import numpy as np
 import moviepy.editor as mp
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader, ffmpeg_parse_infos
+from moviepy.config import get_setting
+from collections import OrderedDict
 from os import listdir
 from os.path import isfile, join
 from settings import *
+from framestore import hasStoredFrames, loadStoredClip
+from packindex import isPack, packManifest, noteEntry
+from proxy import proxyEntry, proxyVideo, proxyAudio
+from renderprofile import useProfile, renderSize, scaledSize
+
+clip_cache = None #Per process, see initClipCache
+clip_infos = {}
 
 def loadBaseClips(pack_name, note_list):
-    only_files = [f.replace(".mp4","") for f in listdir(pack_name) if (isfile(join(pack_name, f)) and f.endswith(".mp4"))]
+    only_files = list(packManifest(pack_name)["notes"])
     clip_array = {}
     for f in only_files:
         if f in note_list:
@@ -19,7 +31,152 @@ def loadHelpClips(clip_array = {}):
     return clip_array
 
 def loadAllClips(pack_name, clip_array = {}):
-    only_files = [f.replace(".mp4","") for f in listdir(pack_name) if (isfile(join(pack_name, f)) and f.endswith(".mp4"))]
+    only_files = list(packManifest(pack_name)["notes"])
     for f in only_files:
         clip_array[f] = mp.VideoFileClip(join(pack_name,(f+".mp4")))
     return clip_array
+
+
+class ClipCache:
+    """
+    LRU cache of opened clips, keyed by the clip path (pack path + note). Every occurrence of a note
+    in a render shares one VideoFileClip. An occurrence that is behind the shared reader doesn't make
+    it seek back, it reads through one of a few extra decoder lanes of the same clip. With
+    USE_FRAME_STORE, notes that are in the frame store are served from it and aren't decoded at all,
+    otherwise the proxy of a note is opened instead of the pack clip when there is one. Pack clips
+    without a proxy are scaled while decoding when the render profile isn't full HD.
+    """
+    def __init__(self, max_clips: int = CLIP_CACHE_SIZE, max_lanes: int = CLIP_CACHE_LANES):
+        self.max_clips = max_clips
+        self.max_lanes = max_lanes
+        self.clips = OrderedDict()
+        self.lanes = {}
+        self.hits = 0
+        self.misses = 0
+        self.reads = 0
+
+    def get(self, directory: str, note: str):
+        path = join(directory, note+".mp4")
+        clip = self.clips.get(path)
+        if clip != None:
+            self.clips.move_to_end(path)
+            self.hits += 1
+            return clip
+
+        self.misses += 1
+        if USE_FRAME_STORE and tuple(FRAME_STORE_SIZE) == renderSize() and hasStoredFrames(directory, note):
+            clip = loadStoredClip(directory, note)
+            self.lanes[path] = [None]
+        else:
+            proxy = proxyVideo(directory, note)
+            size = scaledSize(clipInfo(directory, note)["size"]) if proxy == None and isPack(directory) else None #Pack clips are made for FULL_HD
+            clip = mp.VideoFileClip(proxy or path, audio=proxy == None, target_resolution=size[::-1] if size != None else None)
+            if proxy != None and proxyAudio(directory, note) != None: clip.audio = mp.AudioFileClip(proxyAudio(directory, note))
+            self.lanes[path] = [clip.reader]
+            clip.make_frame = self.laneReader(path, clip.reader)
+        self.clips[path] = clip
+        return clip
+
+    def laneReader(self, path: str, reader):
+        lanes = self.lanes[path]
+        last_use = {}
+
+        def make_frame(t):
+            pos = int(reader.fps*t + 0.00001)+1
+            lane = None
+            for candidate in lanes: #Closest lane that only has to read forward
+                if candidate.pos <= pos <= candidate.pos + 100 and (lane == None or candidate.pos > lane.pos):
+                    lane = candidate
+            if lane == None:
+                if len(lanes) < self.max_lanes:
+                    lane = FFMPEG_VideoReader(reader.filename, pix_fmt=reader.pix_fmt, target_resolution=reader.size[::-1], fps_source="tbr")
+                    lanes.append(lane)
+                else:
+                    lane = min(lanes, key=lambda candidate: last_use.get(id(candidate), 0)) #Rewind the least recently used one
+            self.reads += 1
+            last_use[id(lane)] = self.reads
+            return lane.get_frame(t)
+
+        return make_frame
+
+    def trim(self):
+        """Closes the least recently used clips above max_clips. Call between renders, never during one."""
+        while len(self.clips) > self.max_clips:
+            path, clip = self.clips.popitem(last=False)
+            self.close(path, clip)
+
+    def forget(self, path: str):
+        """Closes the clip of a file that is about to be replaced, the next get opens the new one."""
+        clip = self.clips.pop(path, None)
+        if clip != None: self.close(path, clip)
+
+    def close(self, path: str, clip):
+        for lane in self.lanes.pop(path)[1:]:
+            lane.close()
+        if clip.audio != None: clip.audio.close()
+        clip.close()
+
+class StreamReader:
+    """
+    Decodes one occurrence of a note front to back through its own ffmpeg pipe, for renders that
+    only ever move forward in time. Opening it doesn't probe the file (clipInfo is cached), and it
+    holds a single frame, so a reader costs the same no matter how long the song is.
+    """
+    def __init__(self, directory: str, note: str):
+        proxy = proxyVideo(directory, note)
+        info = proxyEntry(directory, note) if proxy != None else clipInfo(directory, note)
+        self.fps = info["fps"]
+        self.size = tuple(info["size"]) if proxy != None or not isPack(directory) else scaledSize(info["size"])
+        self.duration = info["duration"]
+        self.nbytes = self.size[0] * self.size[1] * 3
+        cmd = [get_setting("FFMPEG_BINARY"), "-v", "error", "-i", proxy or join(directory, note+".mp4"),
+               "-vf", f"scale={self.size[0]}:{self.size[1]}", "-f", "image2pipe", "-pix_fmt", "rgb24", "-vcodec", "rawvideo", "-"]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=self.nbytes)
+        self.pos = -1
+        self.frame = np.zeros((self.size[1], self.size[0], 3), dtype=np.uint8)
+
+    def get_frame(self, t: float):
+        """Frame at t, reading forward. Asking for an earlier time gives the current frame."""
+        pos = int(self.fps*t + 0.00001)
+        while self.pos < pos:
+            data = self.proc.stdout.read(self.nbytes)
+            if len(data) != self.nbytes: break #Past the last frame, keep it
+            self.frame = np.frombuffer(data, dtype=np.uint8).reshape(self.size[1], self.size[0], 3)
+            self.pos += 1
+        return self.frame
+
+    def close(self):
+        if self.proc != None:
+            self.proc.stdout.close()
+            self.proc.terminate()
+            self.proc.wait()
+            self.proc = None
+
+def initClipCache(max_clips: int = CLIP_CACHE_SIZE, max_lanes: int = CLIP_CACHE_LANES, profile: str = None):
+    """Pool initializer, every render worker gets its own clip cache and renders with the profile of the run."""
+    global clip_cache
+    if profile != None: useProfile(profile)
+    clip_cache = ClipCache(max_clips, max_lanes)
+
+def getClip(path: str, note: str):
+    if clip_cache == None: initClipCache()
+    return clip_cache.get(path, note)
+
+def trimClipCache():
+    if clip_cache != None: clip_cache.trim()
+
+def forgetClip(file: str):
+    """Drops what this process cached about a clip file, for help clips that are written again under the same name."""
+    if clip_cache != None: clip_cache.forget(file)
+    clip_infos.pop(file, None)
+
+def clipInfo(path: str, note: str) -> dict:
+    """Duration, fps, size and audio presence of a clip. Pack clips come from the pack manifest, others are read from the file header once per process."""
+    if isPack(path):
+        entry = noteEntry(path, note)
+        if entry != None: return entry
+    file = join(path, note+".mp4")
+    if file not in clip_infos:
+        infos = ffmpeg_parse_infos(file)
+        clip_infos[file] = {"duration": infos["duration"], "fps": infos["video_fps"], "size": list(infos["video_size"]), "audio": infos["audio_found"]}
+    return clip_infos[file]
@@ -1,3 +1,4 @@
+import os
 import mid_to_json_converter as mTj
 import clipper as c
 from organizer import createMainLayout
@@ -8,6 +9,6 @@ if __name__ == '__main__':
 
     #mTj.main(filename)
 
-    createMainLayout(filename)
+    path = createMainLayout(filename)
 
-    c.main(filename)
\ No newline at end of file
+    c.main(filename, os.path.basename(path))
\ No newline at end of file
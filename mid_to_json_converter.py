@@ -1,77 +1,137 @@
 import os
 import json
-from math import floor
-from settings import MIDIS_PATH, JSONS_PATH, NOTE_LIST
+import multiprocessing
+from settings import MIDIS_PATH, JSONS_PATH, MIDI_TO_NOTE
+from score_io import scorePath, findScore, readScore, writeScore
+from hashing import fileHash
 
 try:
-    from mido import MidiFile
+    from mido import MidiFile, tick2second
 except ImportError:
     print("Importing mido")
     os.system('cmd /c "pip install mido"')
-    from mido import MidiFile
+    from mido import MidiFile, tick2second
 
 channel_filter = [ 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20 ]
 minimum_start_delay = 2 # [s]
-
-
-def convert(filename: str = ""):
+cache_name = "conversion_cache.json" # kept in JSONS_PATH
+default_tempo = 500000 # [us per beat] 120 bpm until the first set_tempo
+
+
+class NoteAction:
+    """A single key press (state = True) or release (state = False) at an absolute time in seconds."""
+    __slots__ = ("state", "note", "channel", "time")
+
+    def __init__(self, state: bool, note: int, channel: int, time: float):
+        self.state = state
+        self.note = note # midi note number, see MIDI_TO_NOTE
+        self.channel = channel
+        self.time = time
+
+    def __repr__(self):
+        return f"NoteAction(state={self.state}, note={MIDI_TO_NOTE[self.note]}, channel={self.channel}, time={self.time})"
+
+
+def readMessages(in_path: str):
+    """
+    Yields the messages of a midi file the same way `MidiFile.play()` does, but without waiting
+    between them. Tracks are merged on absolute ticks and the delta ticks are converted to seconds
+    with the tempo map, so the song is read as fast as the file can be parsed.
+    """
+    midi_file = MidiFile(in_path)
+
+    # Merge the tracks like mido.merge_tracks (stable sort on absolute ticks, end_of_track dropped)
+    # without copying and re-checking every message twice
+    timeline = []
+    for track in midi_file.tracks:
+        tick = 0
+        for message in track:
+            tick += message.time
+            if message.type != "end_of_track": timeline.append((tick, message))
+    timeline.sort(key=lambda event: event[0])
+
+    tempo = default_tempo
+    last_tick = 0
+    for tick, message in timeline:
+        if tick > last_tick: delta = tick2second(tick - last_tick, midi_file.ticks_per_beat, tempo)
+        else: delta = 0
+        last_tick = tick
+
+        if message.type == "set_tempo": tempo = message.tempo
+        if message.is_meta: continue # play() doesn't yield meta messages
+
+        yield message.copy(skip_checks=True, time=delta)
+
+
+def decodeMessages(messages, channels) -> list:
+    """
+    Turns note_on/note_off messages into `NoteAction`s by reading the message attributes directly.
+    A note_on with velocity 0 counts as a release. Messages on channels outside `channels` are
+    dropped and, like before, so is their delta time.
+    """
+    channels = set(channels)
+    note_actions = []
+    time = 0.0
+    for message in messages:
+        if message.type == "note_on": state = message.velocity != 0
+        elif message.type == "note_off": state = False
+        else: continue
+        if message.channel not in channels: continue
+
+        time += message.time
+        note_actions.append(NoteAction(state, message.note, message.channel, time))
+
+    return note_actions
+
+
+def pairNotes(note_actions: list) -> list:
+    """
+    Pairs every press with the next action on the same (channel, note) in a single pass and returns
+    (press, duration) tuples in press order. A press that is followed by another press of the same
+    key ends there, so overlapping notes of the same pitch don't swallow each other. Presses that
+    are never released last until the final action of the song.
+    """
+    pairs = []
+    pending = {} # (channel, note) -> index in pairs of the press waiting for its release
+    for action in note_actions:
+        key = (action.channel, action.note)
+        index = pending.pop(key, None)
+        if index is not None:
+            press = pairs[index][0]
+            pairs[index] = (press, action.time - press.time)
+        if action.state:
+            pending[key] = len(pairs)
+            pairs.append((action, None))
+
+    for index in sorted(pending.values()):
+        press = pairs[index][0]
+        pairs[index] = (press, note_actions[-1].time - press.time)
+
+    return pairs
+
+
+def convert(filename: str = "", realtime: bool = False):
         global channel_filter, minimum_start_delay
 
         in_path = os.path.join(MIDIS_PATH, filename)+".mid"
-        out_path = os.path.join(JSONS_PATH, filename)+".json"
+        out_path = scorePath(filename)
 
         print(in_path)
         print(out_path)
 
         # Construct note actions out of the midi data
-        midi_note_actions = []
-        for message in MidiFile(in_path).play():
-            message = str(message).split()
-            
-            state = None
-            channel = None
-            note = None
-            time = None
-            for element in message:
-                if element == "note_on": state = True
-                elif element == "note_off" or state and element[:8] == "velocity" and element.split("=")[1] == "0": state = False
-                elif element[:7] == "channel": channel = int(element.split("=")[1])
-                elif element[:4] == "note":
-                    note_index = int(element.split("=")[1])
-                    note = NOTE_LIST[note_index % 12] + str(floor(note_index / 12) - 1)
-                elif element[:4] == "time": time = float(element.split("=")[1])
-            if channel not in channel_filter or state == None or note == None or time == None: continue
-            
-            if len(midi_note_actions) > 0: time += midi_note_actions[-1]["time"]
-            
-            midi_note_actions.append({ "state":state, "note":note, "channel":channel, "time":time })
-
-            print(midi_note_actions[-1])
-            
-        
+        messages = MidiFile(in_path).play() if realtime else readMessages(in_path)
+        midi_note_actions = decodeMessages(messages, channel_filter)
+        print(f"{len(midi_note_actions)} - note actions read.")
+
         # convert { true, C1, time = 1.5 } and { false, C1, time = 2.5 } to { C1, time = 1.5, duration = 1 }
         print("Converting …")
         note_presses = []
-        index = 0
-        while True:
-            release_index = index + 1
-            while midi_note_actions[release_index]["note"] != midi_note_actions[index]["note"] or midi_note_actions[release_index]["channel"] != midi_note_actions[index]["channel"]:
-                release_index += 1
-            if release_index >= len(midi_note_actions): break
-
-            note = midi_note_actions[index]["note"]
-            time = midi_note_actions[index]["time"]
-            instrument = channel_filter.index(midi_note_actions[index]["channel"])
-            duration = midi_note_actions[release_index]["time"] - midi_note_actions[index]["time"]
-            note_presses.append({"note":note, "instrument":instrument, "time":time, "duration":duration })
-
-            print(len(note_presses), note_presses[-1])
-
-            next_index = index + 1
-            while midi_note_actions[next_index]["state"] == False and next_index + 1 < len(midi_note_actions):
-                next_index += 1
-            index = next_index
-            if index >= len(midi_note_actions) - 1: break
+        for press, duration in pairNotes(midi_note_actions):
+            note = MIDI_TO_NOTE[press.note]
+            instrument = channel_filter.index(press.channel)
+            note_presses.append({"note":note, "instrument":instrument, "time":press.time, "duration":duration })
+        print(f"{len(note_presses)} - notes paired.")
 
         # Add start delay if necessary
         if note_presses[0]["time"] < minimum_start_delay:
@@ -98,9 +158,7 @@ def convert(filename: str = ""):
 
         print("Saving …")
 
-        file = open(out_path, "w")
-        file.write(json.dumps(note_presses).replace("},", "},\n"))
-        file.close()
+        writeScore(out_path, note_presses)
 
         print("Completed!")
         
@@ -115,15 +173,14 @@ def main(filename: str = ""):
 
     if filename != "":
         in_path = os.path.join(MIDIS_PATH, filename)+".mid"
-        out_path = os.path.join(JSONS_PATH, filename)+".json"
+        out_path = findScore(filename)
 
         # Check if output file already exists
-        if os.path.exists(out_path):
+        if out_path != None:
             while True:
-                answer = input("Json file for this midi already exists. Do you want to skip this step? [Y/N] ").strip().lower()
+                answer = input("Score file for this midi already exists. Do you want to skip this step? [Y/N] ").strip().lower()
                 if answer == "j" or answer == "y":
-                    with open(out_path, 'r', encoding='utf-8') as file:
-                        return json.loads(file.read())
+                    return readScore(out_path).toDicts()
                 elif answer == "n": return
 
         # Find midi files
@@ -144,17 +201,82 @@ def main(filename: str = ""):
         convert(filename)
 
     else:
-        # Find midi files
-        midi_files = [file for file in os.listdir(MIDIS_PATH) if file[-4:] == ".mid"]
-        midi_files = sorted(midi_files, key=str.lower)
-        if (len(midi_files) == 0):
-            print(f"Couldn't find a file with extention .mid! Please add mid file in {MIDIS_PATH}")
-            input()
-            exit()
-        
-        for file in midi_files:
-            if file.find("."): file = os.path.splitext(file)[0] # remove extention
-            convert(file)
+        convertAll()
+
+
+def convertWorker(job):
+    """Pool task of convertAll: converts one file with the converter settings of the parent process."""
+    global channel_filter, minimum_start_delay
+    filename, channel_filter, minimum_start_delay = job
+    try:
+        convert(filename)
+    except Exception as e:
+        return filename, repr(e)
+    return filename, None
+
+
+def convertAll(processes: int = None, force: bool = False):
+    """
+    Converts every midi in MIDIS_PATH across a process pool, without asking anything. A midi is
+    skipped when its content hash and the converter settings (channel_filter, minimum_start_delay)
+    match the cache entry of its score. Size and mtime are checked first, so unchanged files aren't
+    even read.
+    """
+    midi_files = [file for file in os.listdir(MIDIS_PATH) if file[-4:] == ".mid"]
+    if (len(midi_files) == 0):
+        print(f"Couldn't find a file with extention .mid! Please add mid file in {MIDIS_PATH}")
+        return
+
+    cache_path = os.path.join(JSONS_PATH, cache_name)
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as file:
+            cache = json.loads(file.read())
+
+    converter_settings = {"channel_filter": list(channel_filter), "minimum_start_delay": minimum_start_delay}
+    jobs = []
+    entries = {}
+    for file in midi_files:
+        filename = os.path.splitext(file)[0]
+        in_path = os.path.join(MIDIS_PATH, file)
+        out_path = scorePath(filename)
+        stat = os.stat(in_path)
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime, "settings": converter_settings}
+        cached = cache.get(filename)
+
+        if not force and cached != None and cached["settings"] == converter_settings and os.path.exists(out_path):
+            if cached["size"] == entry["size"] and cached["mtime"] == entry["mtime"]: continue
+            entry["hash"] = fileHash(in_path)
+            if cached["hash"] == entry["hash"]:
+                cache[filename] = entry # touched but unchanged
+                continue
+        else:
+            entry["hash"] = fileHash(in_path)
+
+        entries[filename] = entry
+        jobs.append((stat.st_size, filename))
+
+    print(f"{len(midi_files) - len(jobs)} - midis unchanged, converting {len(jobs)} …")
+
+    # Largest files first so a big song doesn't start last and hold up the whole batch
+    jobs = [(filename, channel_filter, minimum_start_delay) for _, filename in sorted(jobs, reverse=True)]
+    failed = []
+    try:
+        if jobs:
+            with multiprocessing.Pool(processes=processes) as pool:
+                for filename, error in pool.imap_unordered(convertWorker, jobs):
+                    if error == None: cache[filename] = entries[filename]
+                    else:
+                        cache.pop(filename, None)
+                        failed.append((filename, error))
+    finally:
+        with open(cache_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps(cache).replace("},", "},\n"))
+
+    for filename, error in failed:
+        print(f"Converting {filename} failed: {error}")
+
+    return failed
 
 
 if __name__ == '__main__':
@@ -1,7 +1,7 @@
 import os
 import shutil
 from datetime import datetime
-from settings import help_clips_path, scripts_path
+from settings import help_clips_path, scripts_path, HISTORY_PATH, INCREMENTAL_RENDER
 
 def createDir(path:str):
     path = "./"+path
@@ -12,10 +12,12 @@ def removeDir(path:str):
     shutil.rmtree(path)
 
 def createMainLayout(main_folder: str):
-    path = "./data/history/" + main_folder
+    path = HISTORY_PATH + "/" + main_folder
     if not os.path.exists(path):
         createDir(path+"/helpClips")
         createDir(path+"/scripts")
+    elif INCREMENTAL_RENDER:
+        print("This project already exists, unchanged help clips will be reused.")
     else:
         print("This project already exists!")
         ans = input("Do you want to overwrite it? [Y/N] ").strip().lower()
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+from os import listdir
+from os.path import join, isfile, isdir, dirname, normpath
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from settings import *
+from hashing import fileHash
+
+manifest_name = "manifest.json" # kept in the pack folder (ignored by git), note -> clip properties
+manifests = {} #Per process, pack folder -> manifest, see packManifest
+
+
+def isPack(path: str) -> bool:
+    """Pack folders are the ones directly in PACKS_PATH, help clips and the rest aren't indexed."""
+    return normpath(dirname(normpath(path))) == normpath(PACKS_PATH)
+
+def indexNote(pack_name: str, note: str) -> dict:
+    """Duration, fps, size and audio presence of a pack clip, with the fingerprint of the file they were read from."""
+    path = join(pack_name, note+".mp4")
+    stat = os.stat(path)
+    infos = ffmpeg_parse_infos(path)
+    return {"duration": infos["duration"], "fps": infos["video_fps"], "size": list(infos["video_size"]), "audio": infos["audio_found"],
+            "bytes": stat.st_size, "mtime": stat.st_mtime, "sha256": fileHash(path)}
+
+def buildManifest(pack_name: str = PACK_NAME, force: bool = False) -> dict:
+    """
+    Indexes the note clips of a pack into <pack>/manifest.json. Clips whose size and mtime match the
+    manifest keep their entry, new and changed clips are probed, deleted ones are dropped. The manifest
+    is only written when something changed. Returns {"notes": {note: entry}}.
+    """
+    manifest_path = join(pack_name, manifest_name)
+    old = {}
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            old = json.loads(file.read()).get("notes", {})
+
+    notes = {}
+    changed = 0
+    for f in sorted(listdir(pack_name)):
+        if not (isfile(join(pack_name, f)) and f.endswith(".mp4")): continue
+        note = f.replace(".mp4","")
+        stat = os.stat(join(pack_name, f))
+        entry = old.get(note)
+        if entry == None or entry["bytes"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+            entry = indexNote(pack_name, note)
+            changed += 1
+        notes[note] = entry
+
+    manifest = {"notes": notes}
+    if changed or len(notes) != len(old):
+        print(f"Indexed {changed} clips of {pack_name}, {len(notes)} in the manifest")
+        with open(manifest_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps(manifest).replace("},", "},\n"))
+    return manifest
+
+def packManifest(pack_name: str = PACK_NAME) -> dict:
+    """The manifest of a pack, brought up to date on the first use in a process and kept in memory after that."""
+    key = normpath(pack_name)
+    if key not in manifests: manifests[key] = buildManifest(pack_name)
+    return manifests[key]
+
+def noteEntry(pack_name: str, note: str) -> dict:
+    """Manifest entry of a note, None if the pack doesn't have it."""
+    return packManifest(pack_name)["notes"].get(note)
+
+def packNotes(pack_name: str = PACK_NAME) -> list:
+    """The notes a pack covers, lowest first. Clips that aren't named after a note are left out."""
+    return sorted((note for note in packManifest(pack_name)["notes"] if note in NOTE_TO_MIDI), key=NOTE_TO_MIDI.__getitem__)
+
+def indexPacks(packs_path: str = PACKS_PATH, force: bool = False) -> list:
+    packs = [join(packs_path, f) for f in sorted(listdir(packs_path)) if isdir(join(packs_path, f))]
+    for pack_name in packs:
+        manifests[normpath(pack_name)] = buildManifest(pack_name, force)
+    return packs
+
+
+if __name__ == '__main__':
+    # python packindex.py [pack folder] [--force], every pack in data/packs without a folder
+    args = [arg for arg in sys.argv[1:] if arg != "--force"]
+    force = "--force" in sys.argv[1:]
+    if args: buildManifest(args[0], force)
+    else: indexPacks(PACKS_PATH, force)
+    print("Completed!")
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import cProfile
+from contextlib import contextmanager
+from os.path import join, exists, getsize
+try:
+    import resource
+except ImportError: #Not on Windows, peak memory isn't reported there
+    resource = None
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from settings import *
+import loader
+
+trace_name = "trace.json" # kept in the project folder next to the render history
+worker_profile = None #Per process, see runTask
+
+
+def resetPeakMemory() -> bool:
+    """Starts measuring the peak memory anew (Linux: clear_refs resets VmHWM). False where it can't be reset."""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+def peakMemory() -> int:
+    """
+    Peak resident memory of this process [B] since the last resetPeakMemory, or over the life of the
+    process where that can't be reset. None where it can't be read.
+    """
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmHWM:"): return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource == None: return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 #kB on Linux
+
+def cpuTime() -> float:
+    """
+    User + system time of this process and of the children it waited for so far [s], so the ffmpeg
+    encoders and decoders count too. Workers count their own.
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def clipsOpened() -> int:
+    """Clips the clip cache of this process had to open, hits don't count."""
+    return loader.clip_cache.misses if loader.clip_cache != None else 0
+
+def outputStats(path: str) -> dict:
+    """Bytes and frames of a written clip."""
+    if path == None or not exists(path): return {"bytes_written": 0, "frames": 0}
+    return {"bytes_written": getsize(path), "frames": ffmpeg_parse_infos(path).get("video_nframes", 0)}
+
+def runTask(function, task, profile_path: str = None) -> dict:
+    """
+    Pool task wrapper: runs function(task) and measures it. The function returns the path it wrote.
+    With a profile path, every task of the worker is profiled into one cProfile dump per worker.
+    """
+    global worker_profile
+    opened = clipsOpened()
+    resetPeakMemory()
+    wall, cpu = time.perf_counter(), cpuTime()
+    if profile_path != None:
+        if worker_profile == None: worker_profile = cProfile.Profile()
+        worker_profile.enable()
+    try:
+        path = function(task)
+    finally:
+        if profile_path != None:
+            worker_profile.disable()
+            if not exists(profile_path): os.makedirs(profile_path, exist_ok=True)
+            worker_profile.dump_stats(join(profile_path, "worker-"+str(os.getpid())+".prof"))
+    wall, cpu = time.perf_counter() - wall, cpuTime() - cpu
+
+    metrics = {"task": task["index"] if isinstance(task, dict) else None, "path": path, "worker": os.getpid(),
+               "wall": wall, "cpu": cpu, "peak_memory": peakMemory(), "clips_opened": clipsOpened() - opened}
+    metrics.update(outputStats(path))
+    metrics["fps"] = metrics["frames"] / wall if wall > 0 else 0
+    return metrics
+
+
+class RenderTrace:
+    """
+    Timings of one clipper.main run, written to data/history/<project>/trace.json. Stages run in this
+    process and are timed here, the tasks of the render pool measure themselves (runTask) and are
+    added as they finish. The summary adds the tasks up per stage, to see where the cores went.
+    """
+    def __init__(self, project: str):
+        self.path = join(HISTORY_PATH, project)
+        self.profile_path = join(self.path, "profiles") if PROFILE_WORKERS else None
+        self.started = time.time()
+        self.stages = []
+        self.tasks = []
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times a stage of the run. The yielded record takes extra fields like frames or bytes_written."""
+        record = {"stage": name}
+        opened = clipsOpened()
+        resetPeakMemory()
+        wall, cpu = time.perf_counter(), cpuTime()
+        try:
+            yield record
+        finally:
+            record["wall"] = time.perf_counter() - wall
+            record["cpu"] = cpuTime() - cpu
+            record["peak_memory"] = peakMemory()
+            record["clips_opened"] = clipsOpened() - opened
+            if "frames" in record: record["fps"] = record["frames"] / record["wall"] if record["wall"] > 0 else 0
+            self.stages.append(record)
+
+    def addTask(self, stage: str, metrics: dict):
+        self.tasks.append(dict(metrics, stage=stage))
+
+    def summary(self) -> dict:
+        stages = {}
+        for task in self.tasks:
+            total = stages.setdefault(task["stage"], {"tasks": 0, "wall": 0, "cpu": 0, "frames": 0, "bytes_written": 0, "clips_opened": 0, "peak_memory": 0})
+            total["tasks"] += 1
+            for key in ["wall", "cpu", "frames", "bytes_written", "clips_opened"]:
+                total[key] += task[key]
+            total["peak_memory"] = max(total["peak_memory"], task["peak_memory"] or 0)
+        for total in stages.values():
+            total["fps"] = total["frames"] / total["wall"] if total["wall"] > 0 else 0
+        return stages
+
+    def save(self) -> str:
+        if not exists(self.path): os.makedirs(self.path)
+        path = join(self.path, trace_name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(json.dumps({"started": self.started, "stages": self.stages, "tasks": self.tasks, "summary": self.summary()}, indent=1))
+        print(f"Render trace written to {path}")
+        return path
@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import subprocess
+import multiprocessing
+from os.path import join, exists, basename, normpath
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from settings import *
+from packindex import isPack, packManifest
+from renderprofile import useProfile, renderSize, renderFps, scaledSize
+
+proxy_metas = {} #Per process, proxy folder -> meta.json, see proxyEntry
+
+
+def proxyPath(pack_name: str, size=None, fps: float = None) -> str:
+    """Folder of the render proxies of a pack for a render size and fps, e.g. data/proxies/PianoTestPack/1920x1080 (or 854x480@15)."""
+    if size == None: size, fps = renderSize(), renderFps()
+    name = str(size[0])+"x"+str(size[1]) + ("@"+str(fps) if fps != None else "")
+    return join(PROXY_PATH, basename(normpath(pack_name)), name)
+
+def readMeta(proxy_path: str) -> dict:
+    meta_path = join(proxy_path, "meta.json")
+    if not exists(meta_path): return {}
+    with open(meta_path, "r", encoding="utf-8") as file:
+        return json.loads(file.read())
+
+def transcodeNote(job):
+    """
+    Pool task of buildProxies: transcodes one note clip into an all-intra H.264 proxy of `clip_size`
+    and fps, without audio, and extracts the audio into a .wav next to it.
+    """
+    pack_name, note, size, fps, clip_size, source_entry = job
+    proxy_path = proxyPath(pack_name, size, fps)
+    source = join(pack_name, note+".mp4")
+    video_path = join(proxy_path, note+".mp4")
+    audio_path = join(proxy_path, note+".wav")
+
+    scale = f"scale={clip_size[0]}:{clip_size[1]}"
+    cmd = [get_setting("FFMPEG_BINARY"), "-y", "-v", "error", "-i", source, "-an", "-vf", scale]
+    if fps != None: cmd += ["-r", str(fps)]
+    cmd += ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "12", "-g", "1", "-keyint_min", "1", "-pix_fmt", "yuv420p", video_path]
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+
+    if source_entry["audio"]:
+        cmd = [get_setting("FFMPEG_BINARY"), "-y", "-v", "error", "-i", source, "-vn", "-c:a", "pcm_s16le", audio_path]
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+
+    infos = ffmpeg_parse_infos(video_path)
+    entry = {"duration": infos["duration"], "fps": infos["video_fps"], "size": list(infos["video_size"]), "audio": source_entry["audio"],
+             "bytes": source_entry["bytes"], "mtime": source_entry["mtime"]}
+    return note, entry
+
+def buildProxies(pack_name: str = PACK_NAME, processes: int = None, pool=None) -> str:
+    """
+    Transcodes every note clip of a pack once into a render proxy for the render profile: scaled
+    like the profile scales pack clips and at its fps. Notes whose clip didn't change since the last
+    build (by the pack manifest) are skipped. Runs on `pool` if one is given. Returns the proxy folder.
+    """
+    size, fps = renderSize(), renderFps()
+    proxy_path = proxyPath(pack_name, size, fps)
+    if not exists(proxy_path): os.makedirs(proxy_path)
+
+    meta = readMeta(proxy_path)
+    notes = packManifest(pack_name)["notes"]
+    jobs = []
+    for note, source_entry in notes.items():
+        entry = meta.get(note)
+        if entry != None and entry["bytes"] == source_entry["bytes"] and entry["mtime"] == source_entry["mtime"] and exists(join(proxy_path, note+".mp4")): continue
+        jobs.append((pack_name, note, size, fps, scaledSize(source_entry["size"]), source_entry))
+
+    if jobs:
+        print(f"Transcoding {len(jobs)} clips of {pack_name} into proxies for {size[0]}x{size[1]} …")
+        if pool != None:
+            for note, entry in pool.imap_unordered(transcodeNote, jobs):
+                meta[note] = entry
+        else:
+            with multiprocessing.Pool(processes=processes) as pool:
+                for note, entry in pool.imap_unordered(transcodeNote, jobs):
+                    meta[note] = entry
+    removed = [note for note in meta if note not in notes]
+    for note in removed:
+        del meta[note]
+    if jobs or removed:
+        with open(join(proxy_path, "meta.json"), "w", encoding="utf-8") as file:
+            file.write(json.dumps(meta).replace("},", "},\n"))
+        proxy_metas.pop(proxy_path, None)
+    return proxy_path
+
+def proxyEntry(pack_name: str, note: str, size=None, fps: float = None) -> dict:
+    """
+    Meta entry of the proxy of a note, None if there is no proxy or the pack clip changed since it
+    was made. Only folders in PACKS_PATH have proxies.
+    """
+    if not isPack(pack_name): return None
+    proxy_path = proxyPath(pack_name, size, fps)
+    if proxy_path not in proxy_metas: proxy_metas[proxy_path] = readMeta(proxy_path)
+    entry = proxy_metas[proxy_path].get(note)
+    if entry == None: return None
+    source_entry = packManifest(pack_name)["notes"].get(note)
+    if source_entry == None or source_entry["bytes"] != entry["bytes"] or source_entry["mtime"] != entry["mtime"]: return None
+    return entry
+
+def proxyVideo(pack_name: str, note: str) -> str:
+    """Path of the proxy of a note if it can be used, None otherwise."""
+    if not USE_PROXIES or proxyEntry(pack_name, note) == None: return None
+    return join(proxyPath(pack_name), note+".mp4")
+
+def proxyAudio(pack_name: str, note: str) -> str:
+    """Path of the extracted audio of a note if there is one, None otherwise."""
+    entry = proxyEntry(pack_name, note) if USE_PROXIES else None
+    if entry == None or not entry["audio"]: return None
+    return join(proxyPath(pack_name), note+".wav")
+
+
+if __name__ == '__main__':
+    # python proxy.py [pack folder] [render profile]
+    pack_name = sys.argv[1] if len(sys.argv) > 1 else PACK_NAME
+    useProfile(sys.argv[2] if len(sys.argv) > 2 else RENDER_PROFILE)
+    print(buildProxies(pack_name))
@@ -1,48 +1,169 @@
 import moviepy.editor as mp
-from os.path import join
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from moviepy.config import get_setting
+from moviepy.tools import subprocess_call
+from os.path import join, abspath
+import os
+import math
 import multiprocessing
 import gc
+import numpy as np
 from settings import *
+from loader import initClipCache, getClip, trimClipCache, clipInfo, forgetClip
+from timeline import indexComposite
+from blockcache import BlockCache
+from profiler import runTask
+from renderprofile import renderProfile, renderSize, renderFps
+from blend import blendRamp
+
+def helpClipParams(name: str = None) -> dict:
+    """write_videofile arguments of a help clip format, HELP_CLIP_FORMAT by default."""
+    clip_format = HELP_CLIP_FORMATS[name if name != None else HELP_CLIP_FORMAT]
+    return {"codec": clip_format["codec"], "preset": clip_format["preset"], "ffmpeg_params": list(clip_format["ffmpeg_params"]), "threads": HELP_CLIP_THREADS}
+
+def writeHelpClip(video, path: str):
+    """
+    Writes a help clip to a temporary name and moves it over `path`. The old file may be a hard link
+    into the block cache or a project history, writing it in place would change those too. The clip
+    cache and clip infos of this process forget the old file.
+    """
+    tmp_path = os.path.splitext(path)[0] + ".tmp.mp4"
+    video.write_videofile(tmp_path, fps=renderFps(), audio=not AUDIO_ENGINE, **helpClipParams())
+    os.replace(tmp_path, path)
+    forgetClip(path)
 
 def renderBlockClips(batch_size, blocks):
-    pool = multiprocessing.Pool(processes=batch_size)
-    pool.map(renderClip, blocks)
+    cache = BlockCache() if BLOCK_CACHE else None
+    if cache != None: blocks = cache.restore(blocks)
+    with multiprocessing.Pool(processes=batch_size, initializer=initClipCache, initargs=(CLIP_CACHE_SIZE, CLIP_CACHE_LANES, renderProfile()["name"])) as pool:
+        pool.map(renderClip, blocks)
+    if cache != None: cache.store(blocks)
 
 def renderClip(x):
-    track = []
-    for y in x["notes"]:
-        clip = mp.VideoFileClip(join(x["pack_name"],(y+".mp4")))
-        track.append(clip.subclip(0,clip.duration).set_opacity((1/len(x["notes"]))*(len(x["notes"])-x["notes"].index(y))))
-
-    video = mp.CompositeVideoClip(track,size=(1920, 1080))
-    video.write_videofile(help_clips_path+"/X"+str(x["index"])+".mp4")
+    # The notes are blended with the opacity ramp in one pass per frame (blend.py)
+    clips = [getClip(x["pack_name"], y) for y in x["notes"]]
+    size = renderSize()
+    video = mp.VideoClip(lambda t: blendRamp(clips, t, size), duration=max(clip.duration for clip in clips))
+    video.fps = max(clip.fps for clip in clips)
+    if not AUDIO_ENGINE:
+        audio = [clip.audio for clip in clips if clip.audio != None]
+        if audio != []: video = video.set_audio(mp.CompositeAudioClip(audio).set_duration(video.duration))
+    path = help_clips_path+"/X"+str(x["index"])+".mp4"
+    writeHelpClip(video, path)
+    trimClipCache()
     gc.collect()
+    return path
 
 def renderScriptClips(batch_size, script_list):
-    pool = multiprocessing.Pool(processes=round(batch_size/4) )
-    pool.map(renderScriptClip, script_list)
+    with multiprocessing.Pool(processes=max(1, round(batch_size/4)), initializer=initClipCache, initargs=(CLIP_CACHE_SIZE, CLIP_CACHE_LANES, renderProfile()["name"])) as pool:
+        pool.map(renderScriptClip, script_list)
 
-def renderScriptClip(script):
+def renderScriptClip(chunk):
     track = []
-    start_time = script[0]["time"]
+    start_time = chunk["time"]
 
-    for y in script:
+    for y in chunk["script"]:
         if (y["note"][0] != 'X'):
-            clip = mp.VideoFileClip(join(PACK_NAME,(y["note"]+".mp4")))
+            clip = getClip(PACK_NAME, y["note"])
         else:
-            clip = mp.VideoFileClip(join(help_clips_path,(y["note"]+".mp4")))
+            clip = getClip(help_clips_path, y["note"])
         track.append(clip.set_start(y["time"]-start_time))
 
-    video = mp.CompositeVideoClip(track,size=(1920, 1080))
-    video.write_videofile(help_clips_path+"/Y"+str(y["index"])+".mp4")
+    video = indexComposite(mp.CompositeVideoClip(track,size=renderSize())).set_duration(chunk["end"]-start_time)
+
+    # Notes of earlier chunks that still ring here are heard but not seen
+    if not AUDIO_ENGINE:
+        audio = [video.audio] if video.audio != None else []
+        for y in chunk["tails"]:
+            clip = getClip(PACK_NAME if y["note"][0] != 'X' else help_clips_path, y["note"])
+            if clip.audio != None and start_time - y["time"] < clip.duration:
+                audio.append(clip.audio.subclip(start_time - y["time"]))
+        if audio != []:
+            video = video.set_audio(mp.CompositeAudioClip(audio).set_duration(video.duration))
+
+    path = help_clips_path+"/Y"+str(chunk["index"])+".mp4"
+    writeHelpClip(video, path)
+    trimClipCache()
     gc.collect()
+    return path
 
-def renderFinal(script):
-    track = []
-    for line in script:
-        clip = mp.VideoFileClip(join(help_clips_path,(line["note"]+".mp4")))
-        track.append(clip.set_start(line["time"]))
+def finalSegments(frames: int, gop: int, parts: int) -> list:
+    """Cuts [0, frames) into at most `parts` [first, last) ranges that each start on a keyframe."""
+    per = max(1, math.ceil(math.ceil(frames/gop)/parts)) * gop
+    return [(first, min(first+per, frames)) for first in range(0, frames, per)]
+
+def renderFinalSegment(job):
+    """Pool task of renderFinal: encodes frames [first, last) of the movie, video only. A segment without a chunk on screen is black."""
+    script, first, last, fps, path = job
+    size = renderSize()
+    if script != []:
+        track = [getClip(help_clips_path, line["note"]).set_start(line["time"]) for line in script]
+        video = indexComposite(mp.CompositeVideoClip(track,size=size))
+        make_frame = lambda t: video.get_frame(t).astype("uint8")
+    else:
+        black = np.zeros((size[1], size[0], 3), dtype=np.uint8) #CompositeVideoClip can't be empty
+        make_frame = lambda t: black
+
+    writer = FFMPEG_VideoWriter(path, size, fps, codec="libx264", preset=renderProfile()["preset"], ffmpeg_params=["-g", str(FINAL_GOP)])
+    for k in range(first, last):
+        writer.write_frame(make_frame(k/fps))
+    writer.close()
+    trimClipCache()
+    gc.collect()
+    return path
+
+def renderFinal(script, pool=None, parts: int = None, out_path: str = "movie.mp4", audio_path: str = None, trace=None):
+    """
+    Composites the Y chunks into the movie. The timeline is cut into segments of whole GOPs that are
+    rendered in parallel, then joined without re-encoding by ffmpeg's concat demuxer. Every segment
+    starts with a keyframe, so the joined stream is the same as one written in a single pass. The
+    audio is muxed in at the end, either the given track or the chunks' audio mixed once. With a
+    RenderTrace, every segment is measured and added to it.
+    """
+    if script == []: return
+    infos = [clipInfo(help_clips_path, line["note"]) for line in script]
+    fps = renderFps(max(info["fps"] for info in infos))
+    end = max(line["time"] + info["duration"] for line, info in zip(script, infos))
+    frames = int(math.ceil(end*fps))
+    if parts == None: parts = os.cpu_count() or 1
+
+    jobs = []
+    for k, (first, last) in enumerate(finalSegments(frames, FINAL_GOP, parts)):
+        # Only the chunks that are on screen during the segment
+        lines = [line for line, info in zip(script, infos) if line["time"] < last/fps and line["time"] + info["duration"] > first/fps]
+        jobs.append((lines, first, last, fps, join(help_clips_path, "F"+str(k)+".mp4")))
+
+    own_pool = pool == None
+    if own_pool: pool = multiprocessing.Pool(processes=parts, initializer=initClipCache, initargs=(CLIP_CACHE_SIZE, CLIP_CACHE_LANES, renderProfile()["name"]))
+    try:
+        if trace != None: result = pool.starmap_async(runTask, [(renderFinalSegment, job, trace.profile_path) for job in jobs])
+        else: result = pool.map_async(renderFinalSegment, jobs)
+
+        # Mixed while the segments render, like write_videofile does it
+        audio = [] if audio_path != None else [mp.AudioFileClip(join(help_clips_path, line["note"]+".mp4")).set_start(line["time"]) for line, info in zip(script, infos) if info["audio"]]
+        if audio != []:
+            audio_path = os.path.splitext(out_path)[0] + "TEMP_MPY_wvf_snd.mp3"
+            mp.CompositeAudioClip(audio).set_duration(frames/fps).write_audiofile(audio_path, fps=44100, codec="libmp3lame", logger=None)
+
+        paths = result.get()
+        if trace != None:
+            for k, metrics in enumerate(paths):
+                trace.addTask("final render", dict(metrics, task=k))
+            paths = [metrics["path"] for metrics in paths]
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+
+    list_path = join(help_clips_path, "final_segments.txt")
+    with open(list_path, "w", encoding="utf-8") as file:
+        file.write("".join("file '"+abspath(path)+"'\n" for path in paths))
+
+    cmd = [get_setting("FFMPEG_BINARY"), "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path != None: cmd += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+    cmd += ["-c", "copy", out_path]
+    subprocess_call(cmd, logger=None)
 
-    video = mp.CompositeVideoClip(track,size=FULL_HD)
-    video.write_videofile("movie.mp4")
-    
\ No newline at end of file
+    if not KEEP_TMPS:
+        for path in paths + [list_path] + ([audio_path] if audio_path != None else []):
+            os.remove(path)
@@ -0,0 +1,33 @@
+from settings import *
+
+active = None #Per process, see useProfile
+
+
+def useProfile(name: str = RENDER_PROFILE) -> dict:
+    """Makes one of RENDER_PROFILES the profile every stage of this process renders with."""
+    global active
+    if name not in RENDER_PROFILES: raise ValueError(f"Unknown render profile {name}, pick one of {list(RENDER_PROFILES)}")
+    active = dict(RENDER_PROFILES[name], name=name)
+    return active
+
+def renderProfile() -> dict:
+    if active == None: useProfile()
+    return active
+
+def renderSize() -> tuple:
+    return tuple(renderProfile()["size"])
+
+def renderFps(clip_fps: float = None) -> float:
+    """The fps of the profile, or `clip_fps` for a profile that keeps the one of the clips."""
+    fps = renderProfile()["fps"]
+    return fps if fps != None else clip_fps
+
+def renderScale() -> float:
+    """How much pack clips, which are made for FULL_HD, are scaled in the profile."""
+    return renderSize()[1] / FULL_HD[1]
+
+def scaledSize(size) -> tuple:
+    """A clip size scaled like the profile scales pack clips, rounded to even numbers for the encoders."""
+    scale = renderScale()
+    if scale == 1: return tuple(size)
+    return (max(2, 2*round(size[0]*scale/2)), max(2, 2*round(size[1]*scale/2)))
@@ -0,0 +1,106 @@
+import os
+import heapq
+import itertools
+import queue
+import multiprocessing
+from settings import *
+from loader import initClipCache, clipInfo
+from renderer import renderClip, renderScriptClip
+from profiler import runTask
+from renderprofile import renderProfile
+
+
+def availableMemory() -> int:
+    """Memory the OS can still hand out [B], None if it can't be found out."""
+    try:
+        with open("/proc/meminfo", "r") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"): return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def poolSize(memory_per_worker: int = WORKER_MEMORY) -> int:
+    """One worker per CPU, but no more than fit into the available memory."""
+    processes = os.cpu_count() or 1
+    memory = availableMemory()
+    if memory != None: processes = min(processes, memory // memory_per_worker)
+    return max(1, processes)
+
+def blockCost(block) -> float:
+    """Estimated render cost of a block in clip seconds, the same unit splitLoad uses for chunks."""
+    durations = [clipInfo(block["pack_name"], note)["duration"] for note in block["notes"]]
+    return max(durations) + sum(durations)
+
+def chunkDependencies(chunk) -> set:
+    """Indexes of the X blocks a chunk composites, including those it only hears as tails."""
+    return {int(y["note"][1:]) for y in chunk["script"] + chunk["tails"] if y["note"][0] == 'X'}
+
+
+class RenderScheduler:
+    """
+    One worker pool for a whole clipper.main run. Blocks and chunks are handed out one at a time,
+    most expensive ready task first, so a worker that finishes takes the next best task instead of
+    waiting for a fixed share. A chunk becomes ready as soon as the blocks it uses are rendered,
+    without waiting for the rest of the block stage.
+    """
+    def __init__(self, processes: int = None):
+        self.processes = processes if processes != None else (RENDER_PROCESSES or poolSize())
+        self.pool = multiprocessing.Pool(processes=self.processes, initializer=initClipCache, initargs=(CLIP_CACHE_SIZE, CLIP_CACHE_LANES, renderProfile()["name"]))
+
+    def renderHelpClips(self, blocks, chunks, trace=None):
+        """Renders all X blocks and Y chunks, following the block -> chunk dependencies. With a RenderTrace, every task is measured and added to it."""
+        done = queue.Queue()
+        ready = [] #Heap of (-cost, order, kind, task)
+        order = itertools.count() #Unique per push, so equal costs never compare the tasks
+        waiting = {}
+        dependents = {}
+
+        for block in blocks:
+            heapq.heappush(ready, (-blockCost(block), next(order), "X", block))
+        pending = {block["index"] for block in blocks} #Blocks that aren't given already exist
+        for chunk in chunks:
+            dependencies = chunkDependencies(chunk) & pending
+            if dependencies:
+                waiting[chunk["index"]] = dependencies
+                for index in dependencies:
+                    dependents.setdefault(index, []).append(chunk)
+            else:
+                heapq.heappush(ready, (-chunk["cost"], next(order), "Y", chunk))
+
+        running = 0
+        remaining = len(blocks) + len(chunks)
+        errors = []
+        while remaining > 0:
+            while ready and running < self.processes and not errors:
+                _, _, kind, task = heapq.heappop(ready)
+                function = renderClip if kind == "X" else renderScriptClip
+                args = (function, task, trace.profile_path) if trace != None else (task,)
+                self.pool.apply_async(runTask if trace != None else function, args,
+                    callback=lambda result, kind=kind, index=task["index"]: done.put((kind, index, None, result)),
+                    error_callback=lambda e, kind=kind, index=task["index"]: done.put((kind, index, e, None)))
+                running += 1
+            if running == 0: break
+
+            kind, index, error, result = done.get()
+            running -= 1
+            remaining -= 1
+            if error != None:
+                errors.append((kind+str(index), error))
+                continue
+            if trace != None: trace.addTask("block render" if kind == "X" else "script render", result)
+            if kind == "X":
+                for chunk in dependents.get(index, []):
+                    waiting[chunk["index"]].discard(index)
+                    if not waiting[chunk["index"]]:
+                        heapq.heappush(ready, (-chunk["cost"], next(order), "Y", chunk))
+
+        if errors:
+            raise RuntimeError("Rendering failed: " + ", ".join(name + ": " + repr(error) for name, error in errors))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import numpy as np
+from settings import JSONS_PATH, SCORES_PATH, SCORE_FORMAT
+
+# Known columns get a fixed type, anything else is left to numpy
+COLUMN_TYPES = {
+    "note": np.str_,
+    "pitch": np.int16,
+    "instrument": np.int16,
+    "time": np.float64,
+    "duration": np.float64,
+    "index": np.int32,
+}
+
+
+class Score:
+    """
+    A note script stored column by column (note, instrument, time, duration, ...), one numpy array
+    per column. Indexing with an int gives a row as a dict, slicing or indexing with an array gives
+    a new Score that shares the columns. It is the storage format: the pipeline stages (checkScript,
+    optimizeScript, splitLoad, the renders) still work on the list of dicts from toDicts.
+    """
+    __slots__ = ("columns",)
+
+    def __init__(self, columns: dict):
+        self.columns = columns
+
+    @staticmethod
+    def fromDicts(rows: list):
+        if len(rows) == 0: return Score({})
+        return Score({key: np.array([row[key] for row in rows], dtype=COLUMN_TYPES.get(key)) for key in rows[0]})
+
+    def toDicts(self) -> list:
+        keys = list(self.columns)
+        values = [self.columns[key].tolist() for key in keys]
+        return [dict(zip(keys, row)) for row in zip(*values)]
+
+    def __len__(self):
+        for column in self.columns.values(): return len(column)
+        return 0
+
+    def __getitem__(self, key):
+        if isinstance(key, str): return self.columns[key]
+        if isinstance(key, (int, np.integer)): return {name: column[key].item() for name, column in self.columns.items()}
+        return Score({name: column[key] for name, column in self.columns.items()})
+
+    def __iter__(self):
+        return iter(self.toDicts())
+
+
+def scorePath(filename: str, score_format: str = SCORE_FORMAT) -> str:
+    """Where the score of a song is written: data/jsons for .json, data/scores for the binary format."""
+    if score_format == ".json": return os.path.join(JSONS_PATH, filename)+".json"
+    return os.path.join(SCORES_PATH, filename)+score_format
+
+def findScore(filename: str) -> str:
+    """
+    Path of an existing score of the song, None if there is none. When there is more than one, the
+    newest wins, so a hand edited .json isn't hidden by an older .npz. Ties go to SCORE_FORMAT.
+    """
+    formats = [SCORE_FORMAT] + [score_format for score_format in [".npz", ".json"] if score_format != SCORE_FORMAT]
+    paths = [scorePath(filename, score_format) for score_format in formats]
+    paths = [path for path in paths if os.path.exists(path)]
+    if paths == []: return None
+    newest = max(paths, key=os.path.getmtime) #max keeps the first of equal ones
+    if len(paths) > 1: print(f"Using {newest}, the newest of {', '.join(paths)}")
+    return newest
+
+def writeScore(path: str, script):
+    """Writes a script (Score or list of dicts) as .npz columns or as pretty-printed json, by extension."""
+    directory = os.path.dirname(path)
+    if directory != "" and not os.path.exists(directory): os.makedirs(directory)
+
+    if path.endswith(".json"):
+        if isinstance(script, Score): script = script.toDicts()
+        file = open(path, "w")
+        file.write(json.dumps(script).replace("},", "},\n"))
+        file.close()
+    else:
+        if not isinstance(script, Score): script = Score.fromDicts(script)
+        with open(path, "wb") as file:
+            np.savez(file, **script.columns)
+
+def readScore(path: str) -> Score:
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as file:
+            return Score.fromDicts(json.load(file))
+
+    with np.load(path, allow_pickle=False) as data:
+        return Score({key: data[key] for key in data.files})
+
+
+if __name__ == '__main__':
+    # Import/export between formats: python score_io.py <in.json|in.npz> <out.json|out.npz>
+    writeScore(sys.argv[2], readScore(sys.argv[1]))
+    print("Completed!")
@@ -1,8 +1,13 @@
 import json
-from os import listdir
-from os.path import isfile, join
+import math
+from bisect import bisect_left
 import gc
+import numpy as np
 from settings import *
+from score_io import writeScore
+from loader import clipInfo
+from packindex import packNotes
+from timeline import TimelineIndex
 
 def checkScript(script, pack_name):
     """
@@ -21,27 +26,20 @@ def checkScript(script, pack_name):
     function will return the result of the `transpose` function with the specified transposition value
     applied to the `script` and `pack_name` variables.
     """
-    script_notes = set()
-    pack_notes = sort([f.replace(".mp4","") for f in listdir(pack_name) if (isfile(join(pack_name, f)) and f.endswith(".mp4"))]) #List of suppoorted notes
-    missing_notes = []
-
-    for x in script:
-        script_notes.add(x["note"])
-
-    for note in script_notes:
-        if (note not in pack_notes):
-            missing_notes.append(note)
-
-    script_notes = sort(script_notes)
+    addPitches(script)
+    pack_pitches = [NOTE_TO_MIDI[note] for note in packNotes(pack_name)] #List of suppoorted notes
+    script_pitches = sorted({x["pitch"] for x in script})
+    supported = set(pack_pitches)
+    missing_notes = [MIDI_TO_NOTE[pitch] for pitch in script_pitches if pitch not in supported]
 
     if missing_notes != []:
-        print("Song range: ", script_notes[0], " - ", script_notes[-1])
-        print("Pack range: ", pack_notes[0], " - ", pack_notes[-1])
+        print("Song range: ", MIDI_TO_NOTE[script_pitches[0]], " - ", MIDI_TO_NOTE[script_pitches[-1]])
+        print("Pack range: ", MIDI_TO_NOTE[pack_pitches[0]], " - ", MIDI_TO_NOTE[pack_pitches[-1]])
         print("Missing notes: ", missing_notes)
 
-        if (midiValue(script_notes[-1]) - midiValue(script_notes[0]) < midiValue(pack_notes[-1]) - midiValue(pack_notes[0])):
+        if (script_pitches[-1] - script_pitches[0] < pack_pitches[-1] - pack_pitches[0]):
             print("It's possible to transpose the song.")
-            print("Where to you want to transpose song? MIN:",  (midiValue(pack_notes[0]) - midiValue(script_notes[0])), " MAX:", (midiValue(pack_notes[-1]) - midiValue(script_notes[-1])))
+            print("Where to you want to transpose song? MIN:",  (pack_pitches[0] - script_pitches[0]), " MAX:", (pack_pitches[-1] - script_pitches[-1]))
             value = None
             while(type(value) != int):
                 try:
@@ -50,71 +48,62 @@ def checkScript(script, pack_name):
                     print("You didn't insert a number!")
                 except Exception as e:
                     print("Unresovled error: " + e)
-            if (midiValue(pack_notes[0]) - midiValue(script_notes[0])) < value and (midiValue(pack_notes[-1]) - midiValue(script_notes[-1]) > value and value != 0):
+            if (pack_pitches[0] - script_pitches[0]) < value and (pack_pitches[-1] - script_pitches[-1] > value and value != 0):
                 return transpose(value, script, pack_name)
             
     return script
 
 def transpose(num: int, script, pack_name):
-    for x in range(0,len(script)):
-        script[x]["note"] = keyCode(midiValue(script[x]["note"]) + num)
+    addPitches(script)
+    for x in script:
+        x["pitch"] += num
+        x["note"] = MIDI_TO_NOTE[x["pitch"]]
     return script
 
 def instrumentToPack(script):
     pass
 
+def groupSimultaneous(times, durations):
+    """
+    Groups the notes that start at the same time and last equally long. Notes are sorted by
+    (time, duration) and split where either changes, so equal notes are grouped even when they
+    aren't next to each other. Returns arrays of script indexes, ordered by the first note of each group.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    durations = np.asarray(durations, dtype=np.float64)
+    if len(times) == 0: return []
+
+    order = np.lexsort((durations, times)) #Stable, so notes inside a group keep script order
+    changes = (np.diff(times[order]) != 0) | (np.diff(durations[order]) != 0)
+    groups = np.split(order, np.flatnonzero(changes) + 1)
+    groups.sort(key=lambda group: group[0])
+    return groups
+
 def optimizeScript(script, pack_name):
     note_list = set() #USED NOTES
     new_script = []
-    tmp_script = {"time": 0, "duration": 0}
     blocks = []
-    notes = []
-    shorten = False
-    index = 0
-    note_array = []
-
-    for i in range(0,len(script)):
-        if (len(script) == i):
-            note_list.add(script[i-1]["note"])
-            new_script.append(script[i-1])
-            if (shorten):
-                new_script[-1]["note"] = "X" + str(index)
-                blocks.append({"notes": notes, "time": script[i]["time"], "duration": script[i]["duration"], "index": index, "pack_name": pack_name})
-                index += 1
-                tmp_script = {"time": 0, "duration": 0}
-                notes = []
-                shorten = False
-            break
-
-        if (tmp_script["time"] == script[i]["time"] and tmp_script["duration"] == script[i]["duration"]): #If note has same time and duration as previous one
-            if (not shorten):
-                notes.append(script[i-1]["note"])
-            notes.append(script[i]["note"])
-            shorten = True
-            continue
-        elif (tmp_script["time"] != 0 and tmp_script["duration"] != 0): #add note to script
-            note_list.add(script[i-1]["note"])
-            new_script.append(script[i-1])
-
-            if (shorten): # write a block
-                sort(notes)
-                if notes in note_array:
-                    new_script[-1]["note"] = "X" + str(note_array.index(notes))
-                else:
-                    new_script[-1]["note"] = "X" + str(index)
-                    note_array.append(notes)
-                    blocks.append({"notes": notes, "index": index, "pack_name": pack_name})
-                    index += 1
-                notes = []
-                shorten = False
-            tmp_script = {"time": 0, "duration": 0}
-
-        if (tmp_script["time"] == 0 and tmp_script["duration"] == 0):
-            tmp_script["time"] = script[i]["time"]
-            tmp_script["duration"] = script[i]["duration"]
-
-    file = open(scripts_path+"/optimisedScript.json", "w")
-    file.write(json.dumps(new_script).replace("},", "},\n"))
+    chords = {} #Sorted tuple of distinct pitches -> block index
+
+    addPitches(script)
+    groups = groupSimultaneous([x["time"] for x in script], [x["duration"] for x in script])
+    for group in groups:
+        pitches = tuple(sorted({script[i]["pitch"] for i in group})) #Canonical chord, a note can't be in a block twice
+        note_list.update(MIDI_TO_NOTE[pitch] for pitch in pitches)
+        entry = dict(script[group[-1]])
+
+        if len(pitches) > 1: # write a block
+            if pitches not in chords:
+                chords[pitches] = len(blocks)
+                blocks.append({"notes": [MIDI_TO_NOTE[pitch] for pitch in pitches], "index": len(blocks), "pack_name": pack_name})
+            entry["note"] = "X" + str(chords[pitches])
+            entry["pitch"] = -1 #Blocks aren't a single pitch
+        else:
+            entry["pitch"] = pitches[0]
+            entry["note"] = MIDI_TO_NOTE[pitches[0]]
+        new_script.append(entry)
+
+    writeScore(scripts_path+"/optimisedScript"+SCORE_FORMAT, new_script)
 
     file = open(scripts_path+"/blocks.json", "w")
     file.write(json.dumps(blocks).replace("},", "},\n"))
@@ -123,47 +112,84 @@ def optimizeScript(script, pack_name):
 
     return note_list, new_script, blocks
 
-def splitLoad(script):
+def noteExtents(script, blocks, pack_name):
+    """
+    How long every script entry is on screen when rendered, which is the length of its clip (the
+    longest note for a block), and whether it covers the whole frame and hides everything under it.
+    """
+    ends = []
+    covers = []
+    for x in script:
+        if x["note"][0] == 'X':
+            infos = [clipInfo(pack_name, note) for note in blocks[int(x["note"][1:])]["notes"]]
+            covers.append(True) #Blocks are rendered at full size
+        else:
+            infos = [clipInfo(pack_name, x["note"])]
+            covers.append(tuple(infos[0]["size"]) == tuple(FULL_HD))
+        ends.append(x["time"] + max(info["duration"] for info in infos))
+    return ends, covers
+
+def splitLoad(script, blocks = [], pack_name = PACK_NAME):
+    """
+    Splits the optimised script (in time order) into chunks of about equal render cost. The cost of a chunk is
+    estimated as its time span plus the clip time of all notes in it (span x clips playing at once),
+    in clip seconds. Chunks are only cut where no note is visible across the cut: where nothing is on
+    screen, or at the start of a note that covers the whole frame until every note before it ended
+    (a note that outlasts it would show again in a chunk that no longer has it). Each chunk is rendered up to the start
+    of the next one, so chunks never overlap, and audio of notes that still ring at a cut is carried
+    over as the "tails" of the next chunk.
+    """
     output = []
-    tmp = []
     final_script = []
-    count = 0
-    if (len(script) / 100 > BATCH_SIZE):
-        #Deli na datoteke po 100 not
-        for x in range(0,len(script)):
-            tmp.append(script[x])
-            tmp[-1]["index"] = count
-            if ((x+1) % 101 == 0):
-                output.append(tmp)
-                final_script.append({"note": "Y"+str(count), "time": tmp[0]["time"]})
-                tmp = []
-                count += 1
-    elif (len(script) < 100):
-        for x in script:
-            tmp.append(x)
-            tmp[-1]["index"] = 0
-    else:
-        #Razdeli na enakomerne datoteke do 100 not
-        num_of_elements = round(len(script) / BATCH_SIZE)
-        print(num_of_elements)
-        for x in range(0,len(script)):
-            tmp.append(script[x])
-            tmp[-1]["index"] = count
-            if ((x+1) % num_of_elements == 0):
-                output.append(tmp)
-                final_script.append({"note": "Y"+str(count), "time": tmp[0]["time"]})
-                tmp = []
-                count += 1
-
-    if (tmp != []):
-        output.append(tmp)
-        final_script.append({"note": "Y"+str(count), "time": tmp[0]["time"]})
-
-    file = open(scripts_path+"/splitedScript.json", "w")
-    file.write(json.dumps(output).replace("},", "},\n"))
-
-    file = open(scripts_path+"/final_script.json", "w")
-    file.write(json.dumps(final_script).replace("},", "},\n"))
+    if len(script) == 0: return output, final_script
+
+    ends, covers = noteExtents(script, blocks, pack_name)
+    song_end = max(ends)
+
+    # Cut candidates and the cost up to them
+    candidates = []
+    costs = []
+    cost = 0
+    visible_end = ends[0] #How far the notes before i are on screen
+    for i in range(1, len(script)):
+        cost += ends[i-1] - script[i-1]["time"]
+        if script[i]["time"] > script[i-1]["time"] and (visible_end <= script[i]["time"] or (covers[i] and ends[i] >= visible_end)):
+            candidates.append(i)
+            costs.append(cost + script[i]["time"] - script[0]["time"])
+        visible_end = max(visible_end, ends[i]) #A covering note only hides what ends before it
+    total = cost + ends[-1] - script[-1]["time"] + song_end - script[0]["time"]
+
+    # As many chunks as before: one for short songs, else BATCH_SIZE or chunks of about 100 notes
+    wanted = 1 if len(script) < 100 else max(BATCH_SIZE, math.ceil(len(script) / 101))
+    cuts = [0]
+    for k in range(1, wanted):
+        target = total * k / wanted
+        j = bisect_left(costs, target)
+        j = min([c for c in (j - 1, j) if 0 <= c < len(costs)], key=lambda c: abs(costs[c] - target), default=None)
+        if j != None and candidates[j] > cuts[-1]: cuts.append(candidates[j])
+    cuts.append(len(script))
+
+    index = TimelineIndex([x["time"] for x in script], ends)
+    for count in range(len(cuts) - 1):
+        chunk = script[cuts[count]:cuts[count+1]]
+        start = chunk[0]["time"]
+        end = script[cuts[count+1]]["time"] if cuts[count+1] < len(script) else song_end
+        for x in chunk:
+            x["index"] = count
+        tails = [script[i] for i in index.active(start) if i < cuts[count]]
+        cost = (end - start) + sum(min(ends[i], end) - script[i]["time"] for i in range(cuts[count], cuts[count+1]))
+        output.append({"index": count, "time": start, "end": end, "script": chunk, "tails": tails, "cost": cost})
+        final_script.append({"note": "Y"+str(count), "time": start})
+
+    print("Chunk  notes  start [s]  span [s]  cost [clip s]")
+    for chunk in output:
+        print(f"Y{chunk['index']:<5} {len(chunk['script']):>5} {chunk['time']:>10.2f} {chunk['end']-chunk['time']:>9.2f} {chunk['cost']:>14.2f}")
+
+    writeScore(scripts_path+"/splitedScript"+SCORE_FORMAT, [x for chunk in output for x in chunk["script"]]) #Chunk is in the index column
+    writeScore(scripts_path+"/final_script"+SCORE_FORMAT, final_script)
+
+    file = open(scripts_path+"/chunks.json", "w")
+    file.write(json.dumps([{key: chunk[key] for key in ("index", "time", "end", "cost")} for chunk in output]).replace("},", "},\n"))
 
     gc.collect()
 
@@ -171,18 +197,19 @@ def splitLoad(script):
 
 ## HELP FUNCTIONS ##
 
-def sort(set):
-    set = list(set)
-    for x in range(0,len(set)):
-        for y in range(x+1,len(set)):
-            if (midiValue(set[x]) > midiValue(set[y])):
-                set[x], set[y] = set[y], set[x]
-    return set
+def addPitches(script):
+    """Gives every note of the script its midi number under "pitch", the stages work on those instead of names."""
+    for x in script:
+        if "pitch" not in x: x["pitch"] = NOTE_TO_MIDI[x["note"]]
+    return script
+
+def sort(notes):
+    return sorted(notes, key=NOTE_TO_MIDI.__getitem__)
     
 def midiValue(keyCode):
-    return int(keyCode[-1])*12+int(NOTE_LIST.index(keyCode.rstrip(keyCode[-1])))
+    return NOTE_TO_MIDI[keyCode]
 
 def keyCode(midiValue):
-    return NOTE_LIST[midiValue%12] + str(int(midiValue/12)) 
+    return MIDI_TO_NOTE[midiValue]
 
 ####################
\ No newline at end of file
@@ -1,14 +1,54 @@
 NOTE_LIST = ["A", "A#", "B", "C", "C#", "D", "D#", "E", "F", "F#" ,"G", "G#"]
+MIDI_TO_NOTE = [NOTE_LIST[value % 12] + str(value // 12 - 1) for value in range(128)] #Midi number -> note name
+NOTE_TO_MIDI = {note: value for value, note in enumerate(MIDI_TO_NOTE)} #Note name -> midi number
 FULL_HD = (1920, 1080)
+RENDER_PROFILES = { #Picked per run with clipper.main(..., profile=). size: of the movie, pack clips are scaled by size/FULL_HD. fps: None keeps the one of the clips
+    "final": {"size": FULL_HD, "fps": None, "preset": "medium", "audio_only": False, "output": "movie.mp4"},
+    "draft": {"size": (854, 480), "fps": 15, "preset": "ultrafast", "audio_only": False, "output": "movie_draft.mp4"},
+    "listen": {"size": (854, 480), "fps": 15, "preset": "ultrafast", "audio_only": True, "output": "movie_draft.m4a"},
+}
+RENDER_PROFILE = "final" #Profile of a run that doesn't pick one
+HELP_CLIP_FORMATS = { #Encoding of the X/Y help clips, which are decoded again by the next stage. movie.mp4 is always encoded as the render profile says
+    "h264": {"codec": "libx264", "preset": "medium", "ffmpeg_params": []}, #Lossy, what write_videofile does by default
+    "lossless": {"codec": "libx264rgb", "preset": "ultrafast", "ffmpeg_params": ["-qp", "0", "-g", "1"]}, #Lossless RGB, every frame a keyframe
+    "mjpeg": {"codec": "mjpeg", "preset": "medium", "ffmpeg_params": ["-q:v", "2"]}, #Intra only, near lossless, very fast to decode
+    "raw": {"codec": "rawvideo", "preset": "medium", "ffmpeg_params": ["-f", "mov", "-pix_fmt", "rgb24"]}, #Uncompressed frames in a .mov container (still named .mp4), ~6MB per 1080p frame
+}
+HELP_CLIP_FORMAT = "lossless"
+HELP_CLIP_THREADS = None #Encoder threads per help clip, None lets ffmpeg decide
 BATCH_SIZE = 10  #No more than 10 batches
+RENDER_PROCESSES = None #Workers of the render pool, None to size it from the CPUs and the free memory
+WORKER_MEMORY = 1536 * 1024**2 #Memory one render worker needs at full HD [B]
+FINAL_GOP = 60 #Frames between keyframes of movie.mp4, the final render is split in parallel segments on them
 AUDIO_OFFSET = 0.5 #Seconds of offset
+AUDIO_FPS = 44100
+AUDIO_BLOCK = 10 * AUDIO_FPS #Samples mixed and written at a time
+AUDIO_ENGINE = True #Mix the audio from the notes once (audio.py) and leave it out of the help clips
 KEEP_TMPS = True #Keep temp files
+CLIP_CACHE_SIZE = 48 #Opened clips kept per render worker
+CLIP_CACHE_LANES = 8 #Decoders per cached clip for overlapping occurrences of a note
+USE_FRAME_STORE = False #Decode pack clips once into memory-mapped frames (framestore.py), needs disk: ~6MB per 1080p frame
+FRAME_STORE_SIZE = FULL_HD #Resolution of the stored frames
+USE_PROXIES = True #Render from the all-intra proxies of the pack clips (proxy.py) where they were built, at the size and fps of the render profile
 PACK_NAME = "./data/packs/PianoTestPack"
+DIRECT_RENDER = True #Composite the movie in one pass (compositor.py), False for the X/Y help clips and final composite
+STREAM_RENDER = True #With DIRECT_RENDER, keep notes open only while they play so memory stays flat on long songs
 AFTER_RECORDING_OF_COMPRESSED_BLOCKS = False #Record blocks instead of joining them
+BLOCK_CACHE = True #Keep rendered X blocks in a cache shared by all songs (blockcache.py)
+BLOCK_CACHE_SIZE = 20 * 1024**3 #Bytes the block cache may take before the least recently used blocks go
+INCREMENTAL_RENDER = True #Reuse the help clips of the last render of a project whose notes didn't change (history.py)
+TRACE_RENDER = True #Time every stage and render task of a run into data/history/<project>/trace.json (profiler.py)
+PROFILE_WORKERS = False #With TRACE_RENDER, also dump a cProfile of every render worker next to the trace
+SCORE_FORMAT = ".npz" #Binary columnar scores, ".json" to keep writing pretty-printed json
 
 ######  PATHS  ######
 help_clips_path = "./data/helpClips"
 scripts_path = "./data/scripts"
+HISTORY_PATH = "./data/history"
+BLOCK_CACHE_PATH = "./data/blocks"
 JSONS_PATH = "./data/jsons"
+SCORES_PATH = "./data/scores"
 MIDIS_PATH = "./data/midis"
 PACKS_PATH = "./data/packs"
+FRAME_STORE_PATH = "./data/frames"
+PROXY_PATH = "./data/proxies"
@@ -0,0 +1,62 @@
+import heapq
+from bisect import bisect_left, bisect_right
+
+
+class TimelineIndex:
+    """
+    Index of the [start, end) spans of the notes in a script, for "which notes are playing at time t".
+    Spans are kept sorted by start together with the longest span, so a query only looks at notes
+    that started less than that long ago. Queries cost O(log n + k), where k grows with the polyphony
+    and not with the length of the song (one very long note widens every query, though). Results are
+    positions in the original order, which is the draw order.
+    """
+    def __init__(self, starts, ends):
+        starts = list(starts)
+        ends = list(ends)
+        self.order = sorted(range(len(starts)), key=starts.__getitem__)
+        self.starts = [starts[i] for i in self.order]
+        self.ends = [ends[i] for i in self.order]
+        self.longest = max((end - start for start, end in zip(starts, ends)), default=0)
+
+    def __len__(self):
+        return len(self.order)
+
+    def active(self, t: float) -> list:
+        """Notes with start <= t < end, the same test Clip.is_playing does."""
+        lo = bisect_left(self.starts, t - self.longest)
+        hi = bisect_right(self.starts, t)
+        return sorted(self.order[i] for i in range(lo, hi) if self.ends[i] > t)
+
+    def overlapping(self, t_start: float, t_end: float) -> list:
+        """Notes that play at some point of [t_start, t_end)."""
+        lo = bisect_left(self.starts, t_start - self.longest)
+        hi = bisect_left(self.starts, t_end)
+        return sorted(self.order[i] for i in range(lo, hi) if self.ends[i] > t_start)
+
+    def sweep(self, times):
+        """
+        Yields the active notes for every time of an increasing sequence, like active() but in O(log k)
+        per note start or end, for walking a render frame by frame.
+        """
+        playing = [] #Heap of (end, position)
+        next_start = 0
+        for t in times:
+            while next_start < len(self.starts) and self.starts[next_start] <= t:
+                heapq.heappush(playing, (self.ends[next_start], self.order[next_start]))
+                next_start += 1
+            while playing and playing[0][0] <= t:
+                heapq.heappop(playing)
+            yield sorted(position for _, position in playing)
+
+
+def indexComposite(composite):
+    """
+    Makes a CompositeVideoClip (and its mask) find the clips playing at t through a TimelineIndex,
+    instead of testing every clip on every frame.
+    """
+    for clip in [composite, getattr(composite, "mask", None)]:
+        if clip == None or not hasattr(clip, "playing_clips"): continue
+        clips = clip.clips
+        index = TimelineIndex([c.start for c in clips], [c.end for c in clips])
+        clip.playing_clips = lambda t=0, clips=clips, index=index: [clips[i] for i in index.active(t)]
+    return composite